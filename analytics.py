@@ -0,0 +1,227 @@
+'''Nationwide statistics across every utility's latest CCR year.
+
+Readings are loaded once into a pandas frame with one row per utility and primary contaminant, then
+cached as Parquet. Percentiles, exceedance counts and star ratings for every utility come from a few
+vectorized group-bys, so a page view only does lookups.
+
+    python analytics.py    # rebuild the columnar store from the backend and list the worst utilities
+'''
+from pathlib import Path
+from typing import Optional
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from models import Contaminant, pws_catalog, readings
+from ranking import exceedance_factors, leaderboard, to_array
+from storage import fetch_all, setting
+from units import reported_levels
+import filtration
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['pwsid', 'state', 'contaminant', 'value', 'mclg', 'factor']
+STAR_LABELS = {5: 'Excellent', 4: 'Good', 3: 'Okay', 2: 'Poor', 1: 'Bad'}
+
+
+def _state(pwsid: str) -> str:
+    # EPA PWSIDs start with the two letter state (or tribal region) code
+    return pwsid[:2].upper()
+
+
+def build_frame() -> pd.DataFrame:
+    '''One row per (utility, primary contaminant) for each utility's latest CCR year, in catalog units'''
+    latest = {
+        pwsid: last_updated - 1
+        for pwsid, last_updated in zip(pws_catalog.column('pwsid'), pws_catalog.column('last_updated'))
+        if pwsid and last_updated
+    }
+    lookup = Contaminant.get_lookup()
+
+    keep = []
+    for row in fetch_all(readings):
+        cont = lookup.get(row.get('contaminant'))
+        if cont is None or cont.standard != 'Primary' or latest.get(row.get('origin')) != row.get('year'):
+            continue
+        keep.append((row, cont))
+    if not keep:
+        return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in
+                             zip(COLUMNS, ['object', 'object', 'object', 'float64', 'float64', 'float64'])})
+
+    values = reported_levels([row for row, _ in keep], [cont.units for _, cont in keep])
+    mclg = to_array([cont.mclg for _, cont in keep])
+
+    frame = pd.DataFrame({
+        'pwsid': [row['origin'] for row, _ in keep],
+        'contaminant': [cont.name for _, cont in keep],
+        'value': values,
+        'mclg': mclg,
+    }).dropna(subset=['value'])
+    # Several sampling points for one contaminant: the highest one counts, as in the report
+    frame = frame.groupby(['pwsid', 'contaminant'], as_index=False, sort=False).agg({'value': 'max', 'mclg': 'first'})
+    frame['state'] = frame['pwsid'].map(_state)
+    frame['factor'] = exceedance_factors(frame['value'].to_numpy(), frame['mclg'].to_numpy())
+    return frame[COLUMNS]
+
+
+class NationalStats:
+    '''The Parquet store plus the aggregates derived from it, reloaded when the file changes.
+
+    Page views never build the store: until it exists they get None while one background thread
+    per process builds it, backing off after failures. `python analytics.py` and ingest.py rebuild it explicitly.
+    '''
+
+    def __init__(self, path: str, retry: float = 60.0, max_backoff: float = 3600.0):
+        self.path = Path(path)
+        self.retry = retry
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.failed_at = None
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.frame = None
+        self.ratings = None
+        self.filters = None
+        self.builder = None
+
+    def refresh(self) -> pd.DataFrame:
+        frame = build_frame()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # A temp file of its own, so processes rebuilding at the same time never share one
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix='.tmp')
+        os.close(fd)
+        try:
+            frame.to_parquet(tmp, index=False)
+            # Readers only ever see a complete file
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return frame
+
+    def _build_in_background(self):
+        def build():
+            try:
+                self.refresh()
+                self.failures = 0
+            except Exception:
+                self.failures += 1
+                self.failed_at = time.monotonic()
+                logger.warning('Building %s failed (%d in a row)', self.path, self.failures, exc_info=True)
+            finally:
+                self.builder = None
+
+        # Every page view asks; after a failure wait before scanning the readings again, longer each time
+        if self.failures and time.monotonic() - self.failed_at < min(self.max_backoff, self.retry * 2 ** (self.failures - 1)):
+            return
+        if self.builder is None:
+            self.builder = threading.Thread(target=build, name='analytics', daemon=True)
+            self.builder.start()
+
+    def _derive(self, frame: pd.DataFrame):
+        frame = frame.astype({'pwsid': 'category', 'state': 'category', 'contaminant': 'category'})
+        # Share of utilities reporting the contaminant with a level at or below this one
+        frame['national_pct'] = frame.groupby('contaminant', observed=True)['value'].rank(pct=True, method='max')
+        frame['state_pct'] = frame.groupby(['state', 'contaminant'], observed=True)['value'].rank(pct=True, method='max')
+
+        score = frame.groupby('pwsid', observed=True)['national_pct'].mean()
+        ratings = pd.DataFrame({'score': score, 'state': frame.groupby('pwsid', observed=True)['state'].first()})
+        ratings['stars'] = (5 - np.floor(ratings['score'] * 5)).clip(1, 5).astype(int)
+        # Share of utilities whose typical contaminant ranks worse than this one's
+        ratings['cleaner_than_nation'] = 1 - ratings['score'].rank(pct=True, method='max')
+        ratings['cleaner_than_state'] = 1 - ratings.groupby('state', observed=True)['score'].rank(pct=True, method='max')
+        return frame.set_index(['pwsid', 'contaminant']).sort_index(), ratings
+
+    def load(self, build: bool = False) -> Optional[pd.DataFrame]:
+        '''The frame, or None while the store doesn't exist yet unless `build` waits for it'''
+        with self.lock:
+            try:
+                mtime = self.path.stat().st_mtime
+            except FileNotFoundError:
+                if not build:
+                    self._build_in_background()
+                    return self.frame
+                self.refresh()
+                mtime = self.path.stat().st_mtime
+            if mtime != self.mtime:
+                self.frame, self.ratings = self._derive(pd.read_parquet(self.path))
+                self.filters = None
+                self.mtime = mtime
+            return self.frame
+
+    def percentiles(self, pwsid: str) -> Optional[dict[str, dict[str, float]]]:
+        '''contaminant -> {"state": pct, "nation": pct} for one utility, None until the store exists'''
+        frame = self.load()
+        if frame is None:
+            return None
+        try:
+            rows = frame.loc[pwsid]
+        except KeyError:
+            return {}
+        return {
+            name: {'state': state, 'nation': nation}
+            for name, state, nation in zip(rows.index, rows['state_pct'], rows['national_pct'])
+        }
+
+    def exceedance_counts(self, state: Optional[str] = None) -> pd.Series:
+        '''Utilities above the health goal, per contaminant, most common first'''
+        frame = self.load(build=True)
+        if state is not None:
+            frame = frame[frame['state'] == state]
+        exceeds = frame[frame['factor'] > 0]
+        counts = exceeds.groupby(level='contaminant', observed=True).size()
+        return counts[counts > 0].sort_values(ascending=False)
+
+    def worst(self, contaminant: str, n: int = 10, state: Optional[str] = None) -> pd.DataFrame:
+        '''Top n utilities by exceedance factor for one contaminant'''
+        frame = self.load(build=True)
+        try:
+            rows = frame.xs(contaminant, level='contaminant')
+        except KeyError:
+            return frame.iloc[:0].reset_index()
+        if state is not None:
+            rows = rows[rows['state'] == state]
+        return rows.nlargest(n, ['factor', 'value']).reset_index()
+
+    def leaderboard(self, n: int = 10, state: Optional[str] = None) -> list[tuple[str, float]]:
+        '''(pwsid, worst exceedance factor) for the n worst utilities, nationwide or in one state'''
+        frame = self.load(build=True).reset_index()
+        if state is not None:
+            frame = frame[frame['state'] == state]
+        return leaderboard(frame['pwsid'].astype(str).to_numpy(), frame['factor'].to_numpy(), top=n)
+
+    def rating(self, pwsid: str) -> Optional[dict]:
+        '''{"stars", "label", "score", "cleaner_than_nation", "cleaner_than_state"}, None without readings'''
+        if self.load() is None or pwsid not in self.ratings.index:
+            return None
+        row = self.ratings.loc[pwsid]
+        return {
+            'stars': int(row['stars']),
+            'label': STAR_LABELS[int(row['stars'])],
+            'score': float(row['score']),
+            'cleaner_than_nation': float(row['cleaner_than_nation']),
+            'cleaner_than_state': float(row['cleaner_than_state']),
+        }
+
+    def recommendations(self) -> pd.DataFrame:
+        '''Smallest filter combination per utility (mask, methods, coverage), for product planning'''
+        frame = self.load(build=True)
+        with self.lock:
+            if self.filters is None:
+                self.filters = filtration.recommend_all(frame, Contaminant.get_lookup())
+            return self.filters
+
+
+national = NationalStats(setting('analytics_path', '.cache/analytics.parquet'))
+
+
+if __name__ == '__main__':
+    frame = national.refresh()
+    print(f'{len(frame)} readings from {frame["pwsid"].nunique()} utilities written to {national.path}')
+    for pwsid, factor in national.leaderboard():
+        print(f'{factor:>12,.2f}x  {pwsid}')
@@ -0,0 +1,4 @@
+'''Benchmarks for the model and report pipeline against a local SQLite backend.
+
+    python -m benchmarks --utilities 1000 --output results.json [--compare baseline.json]
+'''
@@ -0,0 +1,210 @@
+import argparse
+import gc
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# Benchmarks always run against a local backend; set before models is imported
+os.environ.setdefault('BACKEND', 'sqlite')
+os.environ.setdefault('SQLITE_PATH', ':memory:')
+os.environ.setdefault('REPORT_CACHE_PATH', ':memory:')
+os.environ.setdefault('LOOKUP_CACHE_PATH', ':memory:')
+os.environ.setdefault('OUTBOX_PATH', ':memory:')
+# Parquet needs a real file; the directory is removed when the run exits
+_scratch = tempfile.TemporaryDirectory(prefix='benchmarks-')
+os.environ.setdefault('ANALYTICS_PATH', os.path.join(_scratch.name, 'analytics.parquet'))
+
+from benchmarks.synthetic import populate
+from analytics import national
+from models import (WaterUtility, Contaminant, ContaminantReading, Primary, Secondary, pws, contaminants, readings,
+                    index, report_cache)
+from ranking import rank_readings
+from records import ContaminantPool, ReadingTable
+import report
+import trends
+
+
+def bench(fn, repeat: int, setup=None) -> dict:
+    '''Times fn() `repeat` times; setup() runs before each call, outside the timer'''
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        'n': repeat,
+        'min_ms': times[0],
+        'median_ms': statistics.median(times),
+        'mean_ms': statistics.fmean(times),
+        'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))],
+    }
+
+
+def retained_kib(build) -> float:
+    '''KiB still allocated once build() returns, i.e. what holding its result costs'''
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size / 1024
+
+
+def measure_memory(wutilities: list[WaterUtility]) -> dict:
+    '''Readings for every utility held as ContaminantReading lists vs ReadingTables sharing one pool'''
+    # Each list as a cache hit hands it out: unpickled, so only readings within one list share a Contaminant
+    pickled = [pickle.dumps(ContaminantReading.get_from_db(each)) for each in wutilities]
+    lists_kib = retained_kib(lambda: [pickle.loads(each) for each in pickled])
+    readings_lists = [pickle.loads(each) for each in pickled]
+    pool = ContaminantPool()
+    tables_kib = retained_kib(lambda: [ReadingTable.from_readings(each, pool=pool) for each in readings_lists])
+    return {
+        'utilities': len(wutilities),
+        'readings': sum(len(each) for each in readings_lists),
+        'reading_lists_kib': lists_kib,
+        'reading_tables_kib': tables_kib,
+        'reduction': lists_kib / tables_kib if tables_kib else float('inf'),
+    }
+
+
+def check_primary_ranking(wutilities: list[WaterUtility]) -> dict:
+    '''Every primary list worst first with NaN factors last, and ranking.rank_readings giving the same
+    factors as Primary; raises AssertionError otherwise'''
+    with_nan = 0
+    for wutility in wutilities:
+        primary = Primary.create_primary_list(ContaminantReading.get_from_db(wutility))
+        factors = np.array([each.factor for each in primary])
+        ranked = rank_readings([each.max_reading for each in primary], [each.perc for each in primary],
+                               [each.mclg for each in primary]).factor
+        assert np.allclose(ranked, factors, equal_nan=True), f'rank_readings and Primary disagree for {wutility.pwsid}'
+        missing = np.isnan(factors)
+        known = factors[~missing]
+        assert not missing.any() or missing[np.argmax(missing):].all(), f'NaN factor before a known one for {wutility.pwsid}'
+        assert (known[:-1] >= known[1:]).all(), f'Primaries out of order for {wutility.pwsid}'
+        with_nan += bool(missing.any())
+    return {'utilities': len(wutilities), 'with_nan_factors': with_nan}
+
+
+def run(args) -> dict:
+    start = time.perf_counter()
+    wutilities = populate(pws, contaminants, readings, args.utilities, args.contaminants, args.years, args.seed,
+                          record_trends=lambda rows: trends.record_many(rows, Contaminant.get_lookup()))
+    # Reports read ratings from the national store; build it now rather than in the background mid-run
+    national.refresh()
+    populate_s = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    territories = [territory for each in wutilities for territory in each['territory']]
+    pick_territory = lambda: (rng.choice(territories),)
+
+    def pick_utility():
+        return (WaterUtility.get_from_db(rng.choice(territories)),)
+
+    def pick_readings():
+        return (ContaminantReading.get_from_db(pick_utility()[0]),)
+
+    def uncached_utility():
+        WaterUtility.get_from_db.clear()
+        return pick_territory()
+
+    def uncached_readings():
+        wutility = pick_utility()[0]
+        ContaminantReading.get_from_db.clear()
+        return (wutility,)
+
+    def uncached_report():
+        wutility = pick_utility()[0]
+        ContaminantReading.get_from_db.clear()
+        report_cache.invalidate()
+        return (wutility,)
+
+    def pick_pwsid():
+        return (rng.choice(wutilities)['pwsid'],)
+
+    def loaded_territory():
+        territory = pick_territory()
+        report.load_report(*territory)
+        return territory
+
+    def cold_territory():
+        WaterUtility.get_from_db.clear()
+        ContaminantReading.get_from_db.clear()
+        report_cache.invalidate()
+        return pick_territory()
+
+    # First call pays for loading the catalog snapshots and building the index
+    results = {'index_build': bench(lambda: index.get_pwsid(territories[0]), 1)}
+    results.update({
+        'territory_index_lookup': bench(index.get_pwsid, args.repeat, pick_territory),
+        'territory_lookup': bench(WaterUtility.get_from_db, args.repeat, uncached_utility),
+        'readings_get_from_db': bench(ContaminantReading.get_from_db, args.repeat, uncached_readings),
+        'create_primary_list': bench(Primary.create_primary_list, args.repeat, pick_readings),
+        'create_secondary_dict': bench(Secondary.create_secondary_dict, args.repeat, pick_readings),
+        'trends_get_series': bench(trends.get_series, args.repeat, pick_pwsid),
+        'build_report': bench(report.build_report, args.repeat, uncached_report),
+        'load_report_cold': bench(report.load_report, args.repeat, cold_territory),
+        # Second load of a territory, as when a visitor comes back to it
+        'load_report_warm': bench(report.load_report, args.repeat, loaded_territory),
+    })
+    sample = rng.sample(territories, min(len(territories), args.memory_sample))
+    utilities = list({each.pwsid: each for each in map(WaterUtility.get_from_db, sample)}.values())
+    return {
+        'params': vars(args),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'populate_s': populate_s,
+        'results': results,
+        'checks': {'primary_ranking': check_primary_ranking(utilities)},
+        'memory': measure_memory(utilities),
+    }
+
+
+def compare(current: dict, baseline: dict):
+    print(f'{"benchmark":<26}{"baseline ms":>14}{"current ms":>14}{"change":>10}')
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        print(f'{name:<26}{before["median_ms"]:>14.3f}{result["median_ms"]:>14.3f}{change:>9.2f}x')
+    if 'memory' in current and 'memory' in baseline:
+        before, after = baseline['memory']['reading_tables_kib'], current['memory']['reading_tables_kib']
+        print(f'{"reading_tables_kib":<26}{before:>14.1f}{after:>14.1f}{after / before if before else float("inf"):>9.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark the model and report pipeline')
+    parser.add_argument('--utilities', type=int, default=100, help='10 to 50,000 synthetic utilities')
+    parser.add_argument('--contaminants', type=int, default=120)
+    parser.add_argument('--years', type=int, default=1, help='CCR years of readings per utility')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory-sample', type=int, default=500, help='Territories whose reports are checked and whose readings are held for the memory comparison')
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    parser.add_argument('--compare', help='Baseline JSON results to compare against')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
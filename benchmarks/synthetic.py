@@ -0,0 +1,131 @@
+from typing import Callable, Optional
+import random
+
+# Real contaminants so reports look plausible; the rest of the catalog is padded with synthetic names
+PRIMARY = ['Lead', 'Copper', 'Arsenic', 'Nitrate', 'Nitrite', 'Fluoride', 'Barium', 'Chromium', 'Uranium',
+           'Radium', 'TTHMs', 'HAA5', 'Chloramine', 'Chlorine', 'Bromate', 'PFOA', 'PFOS', 'Atrazine', 'Benzene']
+SECONDARY = ['TDS', 'Hardness', 'pH', 'Chloride', 'Sulfate', 'Iron', 'Manganese', 'Zinc']
+UNITS = ['ppm', 'ppb', 'ppt']
+STATES = ['CA', 'TX', 'NY', 'FL', 'WA', 'IL', 'AZ', 'CO', 'MA', 'GA']
+CITY_WORDS = ['Spring', 'Lake', 'River', 'Oak', 'Pine', 'Fair', 'Green', 'West', 'North', 'Mount', 'Glen', 'Port']
+CITY_ENDINGS = ['field', 'view', 'wood', 'ville', ' City', ' Heights', 'dale', 'ford', 'ton', ' Springs']
+
+
+def contaminants(count: int = 120, rng: random.Random = None) -> list[dict]:
+    rng = rng or random.Random(0)
+    names = PRIMARY + SECONDARY + [f'Compound {i}' for i in range(max(0, count - len(PRIMARY) - len(SECONDARY)))]
+    rows = []
+    for name in names[:max(count, len(SECONDARY))]:
+        secondary = name in SECONDARY
+        mclg = 0 if rng.random() < 0.15 else round(rng.uniform(0.001, 10), 3)
+        # A few primaries have no health goal on file
+        if rng.random() < 0.05:
+            mclg = None
+        rows.append({
+            'key': f'c-{name}',
+            'name': name,
+            'alt_names': [f'{name} ({i})' for i in range(rng.randint(0, 3))] + [name.upper()],
+            'standard': 'Secondary' if secondary else 'Primary',
+            'type': rng.choice(['Inorganic', 'Organic', 'Radioactive', 'Disinfectant']),
+            'units': '' if name == 'pH' else rng.choice(UNITS),
+            'AC': rng.random() < 0.5,
+            'RO': rng.random() < 0.9,
+            'Ion': rng.random() < 0.3,
+            'mclg': None if secondary else mclg,
+            'mcl': None if secondary else round(max(mclg or 0, 0.01) * rng.uniform(1, 5), 3),
+            'risk': 'Synthetic health risk',
+            'source': 'Synthetic source',
+            'rul': '500' if name == 'TDS' else None,
+            'effects': None,
+        })
+    return rows
+
+
+def utilities(count: int, rng: random.Random = None, last_updated: int = 2023) -> list[dict]:
+    rng = rng or random.Random(1)
+    rows = []
+    zipcode = 10000
+    for i in range(count):
+        state = STATES[i % len(STATES)]
+        territory = []
+        for _ in range(rng.randint(1, 5)):
+            zipcode += 1
+            city = rng.choice(CITY_WORDS) + rng.choice(CITY_ENDINGS)
+            territory.append(f'{city} {state}, {zipcode:05d}')
+        pwsid = f'{state}{i:07d}'
+        rows.append({
+            'key': f'u-{pwsid}',
+            'name': f'{territory[0].split(",")[0]} Water District',
+            'pwsid': pwsid,
+            'street': f'{rng.randint(1, 9999)} Main St',
+            'city_state_zip': territory[0],
+            'supply': 'Synthetic groundwater and surface water',
+            'treatment': 'Synthetic treatment process',
+            'territory': territory,
+            'last_updated': last_updated,
+            'pdf': f'https://example.com/{pwsid}.pdf',
+            'publish': f'{last_updated}-06-30',
+        })
+    return rows
+
+
+def readings(utility: dict, catalog: list[dict], years: int = 1, rng: random.Random = None,
+             per_utility: tuple[int, int] = (20, 70)) -> list[dict]:
+    '''Readings for the utility's latest CCR year and `years - 1` before it'''
+    rng = rng or random.Random(utility['pwsid'])
+    secondary = [each for each in catalog if each['standard'] == 'Secondary']
+    primary = [each for each in catalog if each['standard'] == 'Primary']
+    detected = secondary + rng.sample(primary, min(len(primary), rng.randint(*per_utility)))
+    rows = []
+    for year in range(utility['last_updated'] - years, utility['last_updated']):
+        for cont in detected:
+            # Some readings are reported in other units or under an alt-name, like real CCRs
+            units = cont['units'] if rng.random() < 0.7 or not cont['units'] else rng.choice(UNITS)
+            name = cont['name'] if rng.random() < 0.8 else rng.choice(cont['alt_names'])
+            # Some primaries only report a 90th percentile (e.g. Lead and Copper), a few only an average
+            missing_max = cont['standard'] == 'Primary' and rng.random() < 0.1
+            sparse = cont['standard'] == 'Primary' and rng.random() < 0.03
+            max_reading = None if sparse else '' if missing_max else round(rng.uniform(0, 20), 3)
+            rows.append({
+                'key': f"{utility['pwsid']}-{year}-{cont['name']}",
+                'year': year,
+                'origin': utility['pwsid'],
+                'contaminant': name,
+                'units': units,
+                'max': max_reading,
+                'min': round(rng.uniform(0, 1), 3),
+                'annual_avg': round(rng.uniform(0, 10), 3) if sparse else None,
+                'lraa': None,
+                'raa': None,
+                'ninetieth_perc': None if sparse else round(rng.uniform(0, 20), 3),
+                'violation': int(rng.random() < 0.05),
+                'sample_num': rng.randint(1, 50),
+            })
+    return rows
+
+
+# Fill the pws, contaminants_db and readings collections; returns the generated utilities.
+# `record_trends(rows)` is called with each batch of readings written, as ingest keeps trends current.
+def populate(pws, contaminants_db, readings_db, utility_count: int, contaminant_count: int = 120,
+             years: int = 1, seed: int = 0, chunk_size: int = 1000,
+             record_trends: Optional[Callable[[list[dict]], None]] = None) -> list[dict]:
+    rng = random.Random(seed)
+    catalog = contaminants(contaminant_count, rng)
+    contaminants_db.put_many(catalog)
+    wutilities = utilities(utility_count, rng)
+    for i in range(0, len(wutilities), chunk_size):
+        pws.put_many(wutilities[i:i + chunk_size])
+
+    batch = []
+    for utility in wutilities:
+        batch += readings(utility, catalog, years, rng)
+        if len(batch) >= chunk_size:
+            readings_db.put_many(batch)
+            if record_trends is not None:
+                record_trends(batch)
+            batch = []
+    if batch:
+        readings_db.put_many(batch)
+        if record_trends is not None:
+            record_trends(batch)
+    return wutilities
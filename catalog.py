@@ -0,0 +1,78 @@
+from typing import Callable, Iterator
+import threading
+import time
+
+from storage import fetch_all
+
+
+class CatalogSnapshot:
+    '''One full scan of a collection, held column by column.
+
+    Reloaded on first use after `ttl` seconds have passed or `invalidate()` was called.
+    `version` increases with every reload so derived structures know when to rebuild.
+    '''
+
+    def __init__(self, collection, ttl: float = 600):
+        self.collection = collection
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.version = 0
+        self.size = 0
+        self.columns = {}
+        self.derived = {}
+
+    def refresh(self):
+        columns = {}
+        size = 0
+        for row in fetch_all(self.collection):
+            for name, value in row.items():
+                columns.setdefault(name, [None] * size).append(value)
+            size += 1
+            # Pad columns this row didn't have
+            for values in columns.values():
+                if len(values) < size:
+                    values.append(None)
+
+        self.columns = columns
+        self.size = size
+        self.derived = {}
+        self.version += 1
+        self.loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def ensure(self) -> int:
+        loaded_at = self.loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at >= self.ttl:
+            with self.lock:
+                # Another thread may have refreshed while we waited
+                if self.loaded_at is loaded_at:
+                    self.refresh()
+        return self.version
+
+    def is_current(self, version: int) -> bool:
+        '''Whether `version` is still the one ensure() would return, without reloading'''
+        loaded_at = self.loaded_at
+        return version == self.version and loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+
+    def column(self, name: str) -> list:
+        self.ensure()
+        return self.columns.get(name, [None] * self.size)
+
+    def rows(self) -> Iterator[dict]:
+        self.ensure()
+        columns = self.columns
+        names = list(columns)
+        for i in range(self.size):
+            yield {name: columns[name][i] for name in names}
+
+    def derive(self, name: str, builder: Callable):
+        '''builder(snapshot), computed once per reload'''
+        version = self.ensure()
+        cached = self.derived.get(name)
+        if cached is None or cached[0] != version:
+            cached = (version, builder(self))
+            self.derived[name] = cached
+        return cached[1]
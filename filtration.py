@@ -0,0 +1,149 @@
+'''Smallest set of filtration methods that removes every contaminant above its health goal.
+
+Each contaminant's removal methods are a bitmask over METHODS, so a filter combination is also a
+mask and "does it remove this contaminant" is `mask & combination != 0`. With three methods there
+are only seven combinations, so every one is scored (exceedance factor weighted coverage) with
+NumPy instead of searching.
+
+    python filtration.py    # recommended combination for every utility, counted nationwide
+'''
+from dataclasses import dataclass
+import itertools
+
+import numpy as np
+import pandas as pd
+
+AC, RO, ION = 1, 2, 4
+METHODS = {
+    AC: 'Activated Carbon filtration',
+    RO: 'Reverse Osmosis filtration',
+    ION: 'Ion Exchange',
+}
+# Rough relative price of a household unit, to choose between combinations covering the same contaminants
+COST = {AC: 1, ION: 2, RO: 3}
+# A zero health goal makes the factor infinite; it still has to be covered, it just can't outweigh everything
+MAX_WEIGHT = 1000.0
+
+# Every non-empty combination, fewest methods and cheapest first
+COMBINATIONS = sorted(
+    (sum(each) for n in range(1, len(METHODS) + 1) for each in itertools.combinations(METHODS, n)),
+    key=lambda mask: (bin(mask).count('1'), sum(cost for method, cost in COST.items() if mask & method))
+)
+
+
+def method_mask(contaminant) -> int:
+    '''Removal methods for a Contaminant as a bitmask, from its AC/RO/Ion flags'''
+    return (AC if contaminant.AC else 0) | (RO if contaminant.RO else 0) | (ION if contaminant.Ion else 0)
+
+
+def method_names(mask: int) -> list[str]:
+    return [name for method, name in METHODS.items() if mask & method]
+
+
+def _weights(factor: np.ndarray) -> np.ndarray:
+    return np.minimum(np.nan_to_num(factor, nan=0.0, posinf=MAX_WEIGHT), MAX_WEIGHT)
+
+
+def best_combination(masks: np.ndarray, weights: np.ndarray) -> int:
+    '''The first (smallest, cheapest) combination covering all the weight any combination can cover'''
+    covered = np.array([weights[(masks & combination) != 0].sum() for combination in COMBINATIONS])
+    if not len(weights) or covered.max() <= 0:
+        return 0
+    return COMBINATIONS[int(np.argmax(covered >= covered.max() - 1e-9))]
+
+
+@dataclass(frozen=True)
+class Recommendation:
+    # Methods to combine, the one removing the most exceedance first
+    order: tuple[int, ...]
+    # Share of the total exceedance weight each method adds on top of the ones before it
+    shares: tuple[float, ...]
+    # Contaminants each method removes that the ones before it don't
+    added: tuple[tuple[str, ...], ...]
+    # Contaminants above their health goal, by name
+    covered: tuple[str, ...]
+    uncovered: tuple[str, ...]
+
+    @property
+    def mask(self) -> int:
+        return sum(self.order)
+
+    @property
+    def methods(self) -> list[str]:
+        return [METHODS[method] for method in self.order]
+
+    def to_dict(self) -> dict:
+        return {
+            'methods': self.methods,
+            'shares': list(self.shares),
+            'added': [list(each) for each in self.added],
+            'covered': list(self.covered),
+            'uncovered': list(self.uncovered),
+        }
+
+
+# Recommendation for one utility's ranked primaries (Primary objects, factor already computed)
+def recommend(primaries: list) -> Recommendation:
+    above = [each for each in primaries if float(each.factor) > 0]
+    masks = np.array([method_mask(each.contaminant) for each in above], dtype=np.uint8)
+    weights = _weights(np.array([float(each.factor) for each in above]))
+    best = best_combination(masks, weights)
+
+    names = [each.contaminant.name for each in above]
+
+    def newly_covered(method: int, taken: int) -> np.ndarray:
+        return ((masks & method) != 0) & ((masks & taken) == 0)
+
+    order, shares, added, taken = [], [], [], 0
+    total = weights.sum()
+    while taken != best:
+        method = max((each for each in METHODS if best & each and not taken & each),
+                     key=lambda each: (weights[newly_covered(each, taken)].sum(), -COST[each]))
+        newly = newly_covered(method, taken)
+        order.append(method)
+        shares.append(float(weights[newly].sum() / total) if total else 0.0)
+        added.append(tuple(name for name, ok in zip(names, newly) if ok))
+        taken |= method
+
+    covered = (masks & best) != 0
+    return Recommendation(
+        order=tuple(order),
+        shares=tuple(shares),
+        added=tuple(added),
+        covered=tuple(name for name, ok in zip(names, covered) if ok),
+        uncovered=tuple(name for name, ok in zip(names, covered) if not ok),
+    )
+
+
+def recommend_all(frame: pd.DataFrame, lookup: dict) -> pd.DataFrame:
+    '''Best combination for every utility at once from analytics rows (pwsid, contaminant, factor)'''
+    rows = frame.reset_index()
+    rows = rows[rows['factor'] > 0]
+    name_masks = {name: method_mask(each) for name, each in lookup.items()}
+    masks = rows['contaminant'].astype(str).map(name_masks).fillna(0).to_numpy(dtype=np.uint8)
+    weights = _weights(rows['factor'].to_numpy(dtype=float))
+
+    pwsids = rows['pwsid'].astype(str).to_numpy()
+
+    # Weight each combination would cover, summed per utility: one column per combination
+    columns = {combination: np.where((masks & combination) != 0, weights, 0.0) for combination in COMBINATIONS}
+    grouped = pd.DataFrame({'total': weights, **columns}, index=pwsids).groupby(level=0).sum()
+    covered = grouped[COMBINATIONS].to_numpy()
+    most = covered.max(axis=1, initial=0.0)
+    first = np.argmax(covered >= most[:, None] - 1e-9, axis=1)
+
+    result = pd.DataFrame({
+        'mask': np.where(most > 0, np.array(COMBINATIONS)[first], 0),
+        'coverage': np.divide(most, grouped['total'].to_numpy(), out=np.zeros(len(most)), where=grouped['total'].to_numpy() > 0),
+    }, index=grouped.index.rename('pwsid'))
+    result['methods'] = result['mask'].map(lambda mask: ' + '.join(method_names(mask)) or 'None')
+    return result
+
+
+if __name__ == '__main__':
+    from analytics import national
+
+    recommendations = national.recommendations()
+    print(f'Recommended filtration for {len(recommendations)} utilities with a contaminant above its health goal')
+    for methods, count in recommendations['methods'].value_counts().items():
+        print(f'{count:>8}  {methods}')
@@ -0,0 +1,61 @@
+from typing import Optional
+
+from catalog import CatalogSnapshot
+
+
+def territory_zipcode(territory: str) -> str:
+    '''"city state, zip" -> "zip"'''
+    return territory.rsplit(',', 1)[-1].strip()
+
+
+def _utility_index(snapshot: CatalogSnapshot) -> tuple[dict, dict, dict, dict]:
+    territories, zipcodes, utility_keys, last_updated = {}, {}, {}, {}
+    columns = zip(snapshot.column('key'), snapshot.column('pwsid'), snapshot.column('territory'), snapshot.column('last_updated'))
+    for key, pwsid, territory_lst, year in columns:
+        utility_keys[pwsid] = key
+        last_updated[pwsid] = year
+        for territory in territory_lst or []:
+            territories[territory] = pwsid
+            zipcodes.setdefault(territory_zipcode(territory), []).append(pwsid)
+    return territories, zipcodes, utility_keys, last_updated
+
+
+def contaminant_index(snapshot: CatalogSnapshot) -> dict:
+    '''name or alt-name -> catalog key; Contaminant.get_lookup() resolves names the same way'''
+    contaminant_keys, alt_keys = {}, {}
+    for key, name, alt_names in zip(snapshot.column('key'), snapshot.column('name'), snapshot.column('alt_names')):
+        contaminant_keys[name] = key
+        for alt in alt_names or []:
+            alt_keys.setdefault(alt, key)
+    # Primary names take precedence over alt-names
+    return {**alt_keys, **contaminant_keys}
+
+
+class LookupIndex:
+    '''Process-wide dictionaries over the pws and contaminants_db catalogs.
+
+    Rebuilt whenever the underlying CatalogSnapshot reloads (on its TTL or after a write).
+    '''
+
+    def __init__(self, pws: CatalogSnapshot, contaminants: CatalogSnapshot):
+        self.pws = pws
+        self.contaminants = contaminants
+
+    def get_pwsid(self, territory: str) -> Optional[str]:
+        territories, _, _, _ = self.pws.derive('index', _utility_index)
+        return territories.get(territory)
+
+    def get_pwsids(self, zipcode: str) -> list[str]:
+        _, zipcodes, _, _ = self.pws.derive('index', _utility_index)
+        return zipcodes.get(zipcode, [])
+
+    def utility_key(self, territory: str) -> Optional[str]:
+        territories, _, utility_keys, _ = self.pws.derive('index', _utility_index)
+        return utility_keys.get(territories.get(territory))
+
+    def get_last_updated(self, pwsid: str) -> Optional[int]:
+        _, _, _, last_updated = self.pws.derive('index', _utility_index)
+        return last_updated.get(pwsid)
+
+    def contaminant_key(self, name: str) -> Optional[str]:
+        return self.contaminants.derive('index', contaminant_index).get(name)
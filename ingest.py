@@ -0,0 +1,173 @@
+'''Bulk load CCR readings for many utilities.
+
+    python ingest.py readings.csv [--chunk-size 25] [--workers 4] [--retries 3] [--dry-run]
+
+Accepts CSV, Parquet or JSONL files with ContaminantReading columns (year, origin,
+contaminant, units, max, min, annual_avg, lraa, raa, ninetieth_perc, violation, sample_num).
+A file holds the complete readings for each utility-year in it: once every batch is written,
+stored readings for those utility-years that the file no longer has are deleted.
+'''
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+import argparse
+import math
+import time
+
+import pandas as pd
+
+from analytics import national
+from models import Contaminant, ContaminantReading, readings, report_cache
+from storage import fetch_all
+from units import canonical, conversion_factors
+import trends
+
+REQUIRED = ['year', 'origin', 'contaminant', 'units']
+COLUMNS = [f.name for f in fields(ContaminantReading)]
+INT_COLUMNS = ['year', 'violation', 'sample_num']
+
+
+@dataclass
+class IngestResult:
+    written: int = 0
+    rejected: list[tuple[int, str]] = field(default_factory=list)
+    failed_batches: int = 0
+    removed: int = 0
+
+
+def read_file(path: str) -> pd.DataFrame:
+    suffix = Path(path).suffix.lower()
+    text_columns = {'origin': str, 'contaminant': str, 'units': str}
+    if suffix == '.csv':
+        df = pd.read_csv(path, dtype=text_columns)
+    elif suffix == '.parquet':
+        df = pd.read_parquet(path)
+    elif suffix in ('.jsonl', '.ndjson'):
+        df = pd.read_json(path, lines=True, dtype=text_columns)
+    else:
+        raise ValueError(f'Unsupported file type: {suffix}')
+
+    missing = [each for each in REQUIRED if each not in df.columns]
+    if missing:
+        raise ValueError(f'Missing required columns: {", ".join(missing)}')
+    df['units'] = df['units'].fillna('')
+    return df
+
+
+def _value(value):
+    # Empty cells become None so every backend can store them
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+# Validate rows and resolve contaminant names against one load of the catalog
+def normalize(df: pd.DataFrame) -> tuple[list[dict], list[tuple[int, str]]]:
+    lookup = Contaminant.get_lookup()
+    rows, rejected = [], []
+    occurrences = {}
+    columns = [each for each in COLUMNS if each in df.columns]
+    records = df[columns].to_dict('records')
+
+    units = [canonical(each['units']) for each in records]
+    resolved = [lookup.get(str(each['contaminant']).strip()) for each in records]
+    factors = conversion_factors(units, [cont.units if cont else '' for cont in resolved])
+
+    for i, (record, unit, cont, factor) in enumerate(zip(records, units, resolved, factors)):
+        if cont is None:
+            rejected.append((i, f"Unknown contaminant {record['contaminant']!r}"))
+            continue
+        if math.isnan(factor):
+            rejected.append((i, f"Can't convert {unit!r} to {cont.units!r} for {cont.name}"))
+            continue
+        row = {name: _value(record.get(name)) for name in COLUMNS}
+        if row['year'] is None or not row['origin']:
+            rejected.append((i, 'Missing year or origin'))
+            continue
+        try:
+            for name in INT_COLUMNS:
+                if row[name] is not None:
+                    row[name] = int(row[name])
+        except (TypeError, ValueError):
+            rejected.append((i, f'Non-numeric {name} {row[name]!r}'))
+            continue
+        row['contaminant'] = cont.name
+        row['units'] = unit
+        # Deterministic keys make re-runs and retried batches idempotent; further rows for the same
+        # contaminant (another sampling point, an alt-name) are numbered so they don't overwrite the first.
+        # The numbering only holds within one file, which is why a file replaces its utility-years.
+        key = f"{row['origin']}-{row['year']}-{cont.name}"
+        occurrences[key] = occurrences.get(key, 0) + 1
+        row['key'] = key if occurrences[key] == 1 else f'{key}-{occurrences[key]}'
+        rows.append(row)
+    return rows, rejected
+
+
+def _put_with_retry(collection, batch: list[dict], retries: int) -> bool:
+    for attempt in range(retries + 1):
+        try:
+            collection.put_many(batch)
+            return True
+        except Exception:
+            if attempt == retries:
+                return False
+            time.sleep(0.5 * 2 ** attempt)
+
+
+# Write items in chunks (Deta's put_many takes at most 25) with bounded concurrency
+def put_batches(collection, items: list[dict], chunk_size: int = 25, workers: int = 4, retries: int = 3) -> tuple[int, int]:
+    '''Returns (items written, batches that failed after all retries)'''
+    batches = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda batch: _put_with_retry(collection, batch, retries), batches))
+    written = sum(len(batch) for batch, ok in zip(batches, results) if ok)
+    return written, results.count(False)
+
+
+def remove_stale(rows: list[dict]) -> int:
+    '''Delete stored readings for the utility-years in `rows` that aren't among them; returns how many'''
+    keys = {row['key'] for row in rows}
+    stale = []
+    for origin, year in {(row['origin'], row['year']) for row in rows}:
+        stale += [each['key'] for each in fetch_all(readings, {'origin': origin, 'year': year}) if each['key'] not in keys]
+    for key in stale:
+        readings.delete(key)
+    return len(stale)
+
+
+def ingest(path: str, chunk_size: int = 25, workers: int = 4, retries: int = 3, dry_run: bool = False) -> IngestResult:
+    rows, rejected = normalize(read_file(path))
+    result = IngestResult(rejected=rejected)
+    if dry_run or not rows:
+        return result
+
+    result.written, result.failed_batches = put_batches(readings, rows, chunk_size, workers, retries)
+    # With a batch missing, the old rows are all that's left of some of these readings
+    if not result.failed_batches:
+        result.removed = remove_stale(rows)
+
+    ContaminantReading.get_from_db.clear()
+    lookup = Contaminant.get_lookup()
+    for pwsid in {row['origin'] for row in rows}:
+        report_cache.invalidate(pwsid)
+        # Rebuilt rather than incremented so re-running an ingest doesn't double count
+        trends.rebuild(pwsid, list(fetch_all(readings, {'origin': pwsid})), lookup)
+    # Rebuilt here, once, rather than by the app processes on their next page view
+    national.refresh()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk load CCR readings')
+    parser.add_argument('path')
+    parser.add_argument('--chunk-size', type=int, default=25)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    result = ingest(args.path, args.chunk_size, args.workers, args.retries, args.dry_run)
+    for row, reason in result.rejected:
+        print(f'Rejected row {row}: {reason}')
+    print(f'{result.written} readings written, {result.removed} replaced readings removed, '
+          f'{len(result.rejected)} rejected, {result.failed_batches} batches failed')
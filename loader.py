@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from models import WaterUtility, Contaminant, ContaminantReading, readings, index
+from storage import fetch_all
+import trends
+
+# Shared by every session so backend connections are reused across reruns
+executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='loader')
+
+
+@dataclass
+class ReportData:
+    utility: WaterUtility
+    readings: list[ContaminantReading]
+    trends: dict[str, dict[int, dict]]
+
+
+def _fetch_rows(pwsid: str, last_updated: int) -> list[dict]:
+    return list(fetch_all(readings, {'origin': pwsid, 'year': last_updated - 1}))
+
+
+# Fetch the utility, its readings and the contaminant catalog concurrently instead of one after another
+def load_report_data(territory: str) -> ReportData:
+    pwsid = index.get_pwsid(territory)
+    last_updated = index.get_last_updated(pwsid) if pwsid else None
+    utility_future = executor.submit(WaterUtility.get_from_db, territory)
+    lookup_future = executor.submit(Contaminant.get_lookup)
+    trends_future = executor.submit(trends.get_series, pwsid) if pwsid else None
+    # The index already knows the pwsid and CCR year, so readings don't have to wait for the utility row
+    rows_future = executor.submit(_fetch_rows, pwsid, last_updated) if last_updated else None
+
+    wutility = utility_future.result()
+    if rows_future is None or wutility.last_updated != last_updated:
+        # Territory the index hasn't seen yet, or a utility updated since the catalog snapshot loaded
+        rows_future = executor.submit(_fetch_rows, wutility.pwsid, wutility.last_updated)
+    if trends_future is None:
+        trends_future = executor.submit(trends.get_series, wutility.pwsid)
+
+    return ReportData(
+        utility=wutility,
+        readings=ContaminantReading.from_rows(rows_future.result(), lookup_future.result()),
+        trends=trends_future.result()
+    )
@@ -0,0 +1,160 @@
+'''Bounded, expiring memoization for the per-item backend lookups.
+
+Each cached function keeps an in-process LRU in front of a SQLite file shared by every app worker,
+so a worker that starts cold (e.g. right after a deploy) is warmed by the others. Entries are
+fresh for `ttl` seconds; for another `stale_ttl` seconds they are still returned immediately
+while one background refresh fetches the new value. Only older or missing entries block on the
+backend.
+'''
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import update_wrapper
+from pathlib import Path
+from typing import Callable, Optional
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a cached model changes shape so stale pickles are ignored
+VERSION = 1
+
+# Background revalidation for every cache in the process
+refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+
+
+class DiskTier:
+    '''Pickled lookup results keyed by (cache name, key), shared between processes'''
+
+    def __init__(self, path: str):
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.lock = threading.Lock()
+        self.table = f'lookups_v{VERSION}'
+        with self.lock:
+            if path != ':memory:':
+                self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'name TEXT NOT NULL, key TEXT NOT NULL, stored REAL NOT NULL, value BLOB NOT NULL, '
+                'PRIMARY KEY (name, key))'
+            )
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_stored ON {self.table} (name, stored)')
+
+    def get(self, name: str, key: str) -> Optional[tuple[object, float]]:
+        with self.lock:
+            row = self.conn.execute(
+                f'SELECT value, stored FROM {self.table} WHERE name = ? AND key = ?', [name, key]
+            ).fetchone()
+        return (pickle.loads(row[0]), row[1]) if row else None
+
+    def put(self, name: str, key: str, value: object, stored: float, max_age: float):
+        '''Store one entry and drop this cache's entries older than max_age, which can't be served anymore'''
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.conn.execute(f'INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)', [name, key, stored, blob])
+            self.conn.execute(f'DELETE FROM {self.table} WHERE name = ? AND stored < ?', [name, stored - max_age])
+
+    def clear(self, name: str):
+        with self.lock:
+            self.conn.execute(f'DELETE FROM {self.table} WHERE name = ?', [name])
+
+
+class LookupCache:
+    '''Callable wrapper around one lookup function; see the module docstring'''
+
+    def __init__(self, fn: Callable, name: str, key: Callable, ttl: float, stale_ttl: float, max_entries: int,
+                 disk: Optional[DiskTier] = None):
+        update_wrapper(self, fn)
+        self.fn = fn
+        self.name = name
+        self.key = key
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.disk = disk
+        self.lock = threading.Lock()
+        # key -> (value, stored at)
+        self.entries = OrderedDict()
+        self.refreshing = set()
+
+    def _remember(self, key: str, value: object, stored: float):
+        with self.lock:
+            self.entries[key] = (value, stored)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _load(self, key: str, args: tuple) -> object:
+        value = self.fn(*args)
+        stored = time.time()
+        self._remember(key, value, stored)
+        if self.disk is not None:
+            self.disk.put(self.name, key, value, stored, self.ttl + self.stale_ttl)
+        return value
+
+    def _revalidate(self, key: str, args: tuple):
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def refresh():
+            try:
+                metrics.increment('cache_refreshes_total', cache=self.name)
+                self._load(key, args)
+            except Exception:
+                # Keep serving the stale value; the next call past its age tries again
+                logger.warning('Refreshing %s cache entry %s failed', self.name, key, exc_info=True)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+        refresher.submit(refresh)
+
+    def __call__(self, *args):
+        metrics.increment('cache_calls_total', cache=self.name)
+        key = self.key(*args)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(self.name, key)
+            if entry is not None:
+                metrics.increment('cache_disk_hits_total', cache=self.name)
+                self._remember(key, *entry)
+        if entry is None:
+            metrics.increment('cache_misses_total', cache=self.name)
+            return self._load(key, args)
+
+        value, stored = entry
+        age = time.time() - stored
+        if age < self.ttl:
+            return value
+        if age < self.ttl + self.stale_ttl:
+            metrics.increment('cache_stale_total', cache=self.name)
+            self._revalidate(key, args)
+            return value
+        metrics.increment('cache_misses_total', cache=self.name)
+        return self._load(key, args)
+
+    def clear(self):
+        '''Forget every entry, in this process and in the shared file'''
+        with self.lock:
+            self.entries.clear()
+        if self.disk is not None:
+            self.disk.clear(self.name)
+
+
+def cached(name: str, ttl: float, stale_ttl: float, max_entries: int, disk: Optional[DiskTier] = None,
+           key: Callable = str):
+    '''Decorator; `key(*args)` must turn the call arguments into a string'''
+    def decorator(fn):
+        return LookupCache(fn, name, key, ttl, stale_ttl, max_entries, disk)
+    return decorator
@@ -0,0 +1,187 @@
+'''Lightweight timers and counters for the hot paths.
+
+Everything is kept in process memory and can be read back with `snapshot()`, rendered in the
+Prometheus text format with `render_prometheus()` or served over HTTP with `serve(port)`.
+Each finished trace (e.g. one report view) is also logged as a single JSON line.
+'''
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters = {}
+# (name, labels) -> [count, total seconds, max seconds]
+_timings = {}
+_current_trace = ContextVar('current_trace', default=None)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels):
+    key = _key(name, labels)
+    with _lock:
+        stats = _timings.setdefault(key, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+class Trace:
+    '''Stage timings for one unit of work, logged as one structured line when it finishes'''
+
+    def __init__(self, name: str, **fields):
+        self.name = name
+        self.fields = fields
+        self.stages = {}
+        self.start_time = None
+        self.total = None
+        self.token = None
+
+    def add(self, stage_name: str, seconds: float):
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def start(self) -> 'Trace':
+        self.token = _current_trace.set(self)
+        self.start_time = time.perf_counter()
+        return self
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start_time
+        _current_trace.reset(self.token)
+        observe(f'{self.name}_seconds', self.total)
+        logger.info(json.dumps({
+            'event': self.name,
+            **self.fields,
+            'total_ms': round(self.total * 1000, 3),
+            'stages_ms': self.stages_ms(),
+        }, default=str))
+
+    def stages_ms(self) -> dict[str, float]:
+        return {stage_name: round(seconds * 1000, 3) for stage_name, seconds in self.stages.items()}
+
+
+@contextmanager
+def trace(name: str, **fields):
+    current = Trace(name, **fields).start()
+    try:
+        yield current
+    finally:
+        current.finish()
+
+
+@contextmanager
+def stage(stage_name: str):
+    '''Times a pipeline stage globally and within the current trace, if any'''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe('stage_seconds', seconds, stage=stage_name)
+        current = _current_trace.get()
+        if current is not None:
+            current.add(stage_name, seconds)
+
+
+class InstrumentedCollection:
+    '''Times and counts every backend call made through the wrapped collection'''
+
+    OPERATIONS = {'fetch', 'get', 'insert', 'put', 'put_many', 'delete'}
+
+    def __init__(self, collection, name: str):
+        self.collection = collection
+        self.name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self.collection, attr)
+        if attr not in self.OPERATIONS:
+            return value
+
+        def call(*args, **kwargs):
+            increment('backend_calls_total', collection=self.name, op=attr)
+            with timer('backend_call_seconds', collection=self.name, op=attr):
+                return value(*args, **kwargs)
+        return call
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        timings = {key: list(stats) for key, stats in _timings.items()}
+    return {'counters': counters, 'timings': timings}
+
+
+def cache_stats() -> dict[str, dict]:
+    '''Calls, misses and hits for each instrumented cache'''
+    counters = snapshot()['counters']
+    stats = {}
+    for (name, labels), value in counters.items():
+        if name in ('cache_calls_total', 'cache_misses_total'):
+            cache_name = dict(labels)['cache']
+            stats.setdefault(cache_name, {'calls': 0, 'misses': 0})[name.split('_')[1]] = value
+    for each in stats.values():
+        each['hits'] = max(0, each['calls'] - each['misses'])
+    return stats
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def render_prometheus() -> str:
+    data = snapshot()
+    lines = []
+    for (name, labels), value in sorted(data['counters'].items()):
+        lines.append(f'tapwater_{name}{_labels(labels)} {value}')
+    for cache_name, each in sorted(cache_stats().items()):
+        lines.append(f'tapwater_cache_hits_total{_labels((("cache", cache_name),))} {each["hits"]}')
+    for (name, labels), (count, total, maximum) in sorted(data['timings'].items()):
+        lines.append(f'tapwater_{name}_count{_labels(labels)} {count}')
+        lines.append(f'tapwater_{name}_sum{_labels(labels)} {total:.6f}')
+        lines.append(f'tapwater_{name}_max{_labels(labels)} {maximum:.6f}')
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int) -> ThreadingHTTPServer:
+    '''Serve render_prometheus() on http://0.0.0.0:<port>/ from a daemon thread'''
+    server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
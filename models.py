@@ -1,15 +1,33 @@
 from dataclasses import dataclass, asdict, field, fields
 from typing import Optional
-from deta import Deta
-import streamlit as st
 import numpy as np
-import operator
-
-deta = Deta(st.secrets['deta_key'])
-pws = deta.Base('pws')
-contaminants = deta.Base('contaminants_db')
-readings = deta.Base('readings')
-zip_request = deta.Base('zip_request')
+import hashlib
+
+from storage import LazyCollection, setting, fetch_all, fetch_first
+from catalog import CatalogSnapshot
+from index import LookupIndex, contaminant_index
+from report_cache import ReportCache
+from outbox import Outbox
+from units import calibrate, unit_name
+from ranking import rank_readings, to_array
+from lookup_cache import DiskTier, cached
+import trends
+
+# The backend client is only created when a collection is first used
+pws = LazyCollection('pws')
+contaminants = LazyCollection('contaminants_db')
+readings = LazyCollection('readings')
+zip_request = LazyCollection('zip_request')
+# Full-collection scans are served from snapshots reloaded every `catalog_ttl` seconds or after a write
+pws_catalog = CatalogSnapshot(pws, ttl=float(setting('catalog_ttl', 600)))
+contaminant_catalog = CatalogSnapshot(contaminants, ttl=float(setting('catalog_ttl', 600)))
+index = LookupIndex(pws_catalog, contaminant_catalog)
+report_cache = ReportCache(setting('report_cache_path', '.cache/reports.db'))
+# Per-item lookups: in-process LRU over a file shared by all app workers, refreshed in the background
+lookup_disk = DiskTier(setting('lookup_cache_path', '.cache/lookups.db'))
+STALE_TTL = float(setting('cache_stale_ttl', 86400))
+# Form submissions are written behind so a slow backend never blocks the page
+zip_outbox = Outbox(setting('outbox_path', '.cache/outbox.db'), zip_request, interval=float(setting('outbox_interval', 5)))
 
 
 @dataclass
@@ -20,6 +38,26 @@ class ZipRequest:
     def add_to_db(self):
         zip_request.insert(asdict(self))
 
+    # Queue the request for the background writer; False if this zipcode and email were already submitted
+    def submit(self) -> bool:
+        request = ZipRequest(self.zipcode.strip(), self.email.strip().lower())
+        key = hashlib.sha1(f'{request.zipcode}|{request.email}'.encode()).hexdigest()[:16]
+        return zip_outbox.enqueue(key, asdict(request))
+
+    # Zipcodes by number of distinct requesters, most wanted first, to decide what to ingest next
+    @staticmethod
+    def get_demand(include_covered: bool = False) -> list[tuple[str, int]]:
+        requesters = {}
+        for each in fetch_all(zip_request):
+            zipcode = str(each.get('zipcode') or '').strip()
+            if zipcode:
+                requesters.setdefault(zipcode, set()).add(str(each.get('email') or '').strip().lower())
+        demand = [
+            (zipcode, len(emails)) for zipcode, emails in requesters.items()
+            if include_covered or not index.get_pwsids(zipcode)
+        ]
+        return sorted(demand, key=lambda each: (-each[1], each[0]))
+
 
 @dataclass
 class WaterUtility:
@@ -41,20 +79,20 @@ class WaterUtility:
     # Get all "city state, zip" for all water utilities
     def get_all() -> list[str]:
         territory = ['']
-        wutility = pws.fetch().items
-        for each in wutility:
-            territory += each['territory']
+        for each in pws_catalog.column('territory'):
+            territory += each
         return territory
     
     def get_all_pwsid() -> list[str]:
         pwsid_lst = ['']
-        pwsid = pws.fetch().items
-        for each in pwsid:
-            pwsid_lst.append(each['pwsid'])
+        pwsid_lst += pws_catalog.column('pwsid')
         return pwsid_lst
 
     def add_to_db(self):
         pws.insert(asdict(self))
+        pws_catalog.invalidate()
+        WaterUtility.get_from_db.clear()
+        report_cache.invalidate(self.pwsid)
 
     # Create a function to sort contaminants in descending order of contaminant reading relative to standard
     def get_primary(readings: list):
@@ -67,12 +105,24 @@ class WaterUtility:
         return secondary_dict
 
 
+    # Create a staticmethod to return WaterUtility object by pwsid
+    @staticmethod
+    def get_by_pwsid(pwsid: str):
+        utility = fetch_first(pws, {'pwsid': pwsid})
+        if utility is None:
+            return None
+        utility.pop('key')
+        return WaterUtility(**utility)
+
     # Create a staticmethod to return WaterUtility object by territory
     @staticmethod
-    @st.cache_data(show_spinner=False)
+    @cached('utility', ttl=float(setting('utility_cache_ttl', 3600)), stale_ttl=STALE_TTL, max_entries=5000, disk=lookup_disk)
     def get_from_db(territory: str):
-        # Fetch item by key
-        utility = pws.fetch({'territory?contains': territory}).items[0]
+        # Fetch item by key, falling back to a scan for territories the index hasn't seen yet
+        key = index.utility_key(territory)
+        utility = pws.get(key) if key else None
+        if utility is None:
+            utility = fetch_first(pws, {'territory?contains': territory})
         utility.pop('key')
         return WaterUtility(**utility)
 
@@ -120,40 +170,51 @@ class Contaminant:
     # Get all contaminant names
     def get_all() -> list[str]:
         cont_lst = ['']
-        cont = contaminants.fetch().items
-        for each in cont:
-            cont_lst.append(each['name'])
+        cont_lst += contaminant_catalog.column('name')
         return cont_lst
     
     # Get all units
     def get_all_units() -> list[str]:
         units_lst = ['']
-        units = contaminants.fetch().items
-        for each in units:
-            units_lst.append(each['units'])
+        units_lst += contaminant_catalog.column('units')
         return units_lst
     
     def add_to_db(self):
         contaminants.insert(asdict(self))
+        contaminant_catalog.invalidate()
+        # Lookups cached None for this name, and readings lists dropped it as unknown
+        Contaminant.get_from_db.clear()
+        ContaminantReading.get_from_db.clear()
+        report_cache.invalidate()
 
     def get_units_name(self):
-        full_name = ''
-        if self.units == 'ppt': full_name = 'parts per trillion'
-        elif self.units == 'ppb': full_name = 'parts per billion'
-        elif self.units == 'ppm': full_name = 'parts per million'
-        return f'{full_name} ({self.units})'
+        return f'{unit_name(self.units)} ({self.units})'
 
     # Create a staticmethod to return Contaminant object by name
     @staticmethod
-    @st.cache_data(show_spinner=False)
+    @cached('contaminant', ttl=float(setting('contaminant_cache_ttl', 3600)), stale_ttl=STALE_TTL, max_entries=1000, disk=lookup_disk)
     def get_from_db(ctmnt: str):
-        # Fetch item by key
-        contaminant = contaminants.fetch([{'name': ctmnt}, {'alt_names?contains': ctmnt}])
-        if contaminant.count > 0:
-            contaminant.items[0].pop('key')
-            return Contaminant(**contaminant.items[0])
-        else:
-            return None
+        # Fetch item by key, falling back to a scan for names the index hasn't seen yet
+        key = index.contaminant_key(ctmnt)
+        contaminant = contaminants.get(key) if key else None
+        if contaminant is None:
+            contaminant = fetch_first(contaminants, [{'name': ctmnt}, {'alt_names?contains': ctmnt}])
+            if contaminant is None:
+                return None
+        contaminant.pop('key')
+        return Contaminant(**contaminant)
+
+    # Create a staticmethod to return a name/alt-name -> Contaminant lookup for the whole catalog
+    @staticmethod
+    def get_lookup() -> dict:
+        return contaminant_catalog.derive('lookup', Contaminant._build_lookup)
+
+    def _build_lookup(snapshot: CatalogSnapshot) -> dict:
+        by_key = {}
+        for each in snapshot.rows():
+            key = each.pop('key')
+            by_key[key] = Contaminant(**each)
+        return {name: by_key[key] for name, key in snapshot.derive('index', contaminant_index).items()}
 
 
 
@@ -176,23 +237,35 @@ class ContaminantReading:
 
     def add_to_db(self):
         cr = asdict(self)
+        # Stored by name; asdict turns a Contaminant into a dict
+        cr['contaminant'] = getattr(self.contaminant, 'name', self.contaminant)
         readings.insert(cr)
+        try:
+            # Keep the year-over-year aggregates current instead of recomputing them on read
+            trends.record(cr, Contaminant.get_lookup())
+        finally:
+            # The reading is stored either way
+            ContaminantReading.get_from_db.clear()
+            report_cache.invalidate(self.origin)
     
     
     # Get a list of ContaminantReading dicts from database
     @staticmethod
-    @st.cache_data(show_spinner=False)
+    @cached('readings', ttl=float(setting('readings_cache_ttl', 600)), stale_ttl=STALE_TTL, max_entries=2000, disk=lookup_disk,
+            key=lambda wutility: f'{wutility.pwsid}|{wutility.last_updated}')
     def get_from_db(wutility: WaterUtility) -> list[dict]:
+        creadings = fetch_all(readings, {'origin': wutility.pwsid, 'year': wutility.last_updated-1})
+        # Resolve every reading against one catalog load instead of one query per reading
+        return ContaminantReading.from_rows(creadings, Contaminant.get_lookup())
+
+    # Build ContaminantReading objects from raw rows, dropping unknown contaminants
+    @staticmethod
+    def from_rows(creadings, lookup: dict) -> list:
         cr_list = []
-        creadings = readings.fetch({'origin': wutility.pwsid, 'year': wutility.last_updated-1}).items
-        completion = st.progress(0.0)
-        count = 1
         for cr in creadings:
-            completion.progress(count/len(creadings))
-            count +=1
-            cr.pop('key')
+            cr.pop('key', None)
             cr_obj = ContaminantReading(**cr)
-            cont_obj = Contaminant.get_from_db(cr_obj.contaminant)
+            cont_obj = lookup.get(cr_obj.contaminant)
             cr_obj.contaminant = cont_obj
             if cr_obj.contaminant == None: continue
             cr_list.append(cr_obj)
@@ -232,48 +305,38 @@ class Primary:
 
 
     def __post_init__(self):
-        if float(self.mclg) == 0:
+        # Missing values arrive as '' (CCR data), None (stored as null) or NaN; to_array makes them all NaN
+        mclg, max_reading, perc = to_array([self.mclg, self.max_reading, self.perc])
+        if mclg == 0:
             self.factor = float('inf')
-        elif self.max_reading == '':
-            self.factor = float(self.perc)/float(self.mclg) - 1
+        elif np.isnan(max_reading):
+            self.factor = float(perc/mclg - 1)
         else:
-            self.factor = float(self.max_reading)/float(self.mclg) - 1
+            self.factor = float(max_reading/mclg - 1)
 
     
     @staticmethod
     def create_primary_list(readings):
         primary = []
+        # Convert all primary readings at once without touching the (cached) inputs
+        readings = calibrate([each for each in readings if each.contaminant.standard == 'Primary'])
         for each in readings:
-            if each.contaminant.standard == 'Primary':
-                each = calibrate_units(each)
-                obj = Primary(
-                    year=each.year,
-                    contaminant=each.contaminant,
-                    max_reading=each.max,
-                    mclg=each.contaminant.mclg,
-                    mcl=each.contaminant.mcl,
-                    perc=each.ninetieth_perc
-                )
-                primary.append(obj)
-        return sorted(primary, key=operator.attrgetter('factor'), reverse=True)
-
-
-
+            obj = Primary(
+                year=each.year,
+                contaminant=each.contaminant,
+                max_reading=each.max,
+                mclg=each.contaminant.mclg,
+                mcl=each.contaminant.mcl,
+                perc=each.ninetieth_perc
+            )
+            primary.append(obj)
+        # Worst first, ranked in one pass; NaN factors (no health goal or no usable reading) go last
+        ranking = rank_readings([each.max_reading for each in primary], [each.perc for each in primary],
+                                [each.mclg for each in primary])
+        return [primary[i] for i in ranking.order]
+
+
+
+# Return a copy of the reading with its values in the contaminant's units (see units.calibrate)
 def calibrate_units(c_reading):
-    if c_reading.contaminant.units == c_reading.units:
-        return c_reading
-    
-    if c_reading.contaminant.units == 'ppt':
-        if c_reading.units == 'ppb': c_reading.max = float(c_reading.max) * 1000
-        if c_reading.units == 'ppm': c_reading.max = float(c_reading.max) * 1000000
-    
-    elif c_reading.contaminant.units == 'ppb':
-        if c_reading.units == 'ppt': c_reading.max = float(c_reading.max) / 1000
-        if c_reading.units == 'ppm': c_reading.max = float(c_reading.max) * 1000
-
-    elif c_reading.contaminant.units == 'ppm':
-        if c_reading.units == 'ppt': c_reading.max = float(c_reading.max) / 1000000
-        if c_reading.units == 'ppb': c_reading.max = float(c_reading.max) / 1000
-
-    return c_reading
-
+    return calibrate([c_reading])[0]
@@ -0,0 +1,116 @@
+'''Durable write-behind queue in front of a collection.
+
+Submissions are committed to a local SQLite outbox and acknowledged immediately; a daemon thread
+flushes them to the backend with put_many in batches and retries with backoff until they land.
+Items are keyed by content, so re-submissions are dropped locally and a batch sent twice (e.g. by
+two app processes sharing the file) just overwrites the same documents.
+
+    python outbox.py [--top 20]    # flush what's pending and print zipcode demand
+'''
+from pathlib import Path
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    '''SQLite outbox for one collection; enqueue() never touches the backend'''
+
+    def __init__(self, path: str, collection, batch_size: int = 25, interval: float = 5.0, max_backoff: float = 300.0):
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.lock = threading.Lock()
+        self.collection = collection
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.worker = None
+        with self.lock:
+            if path != ':memory:':
+                self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS outbox ('
+                'key TEXT PRIMARY KEY, data TEXT NOT NULL, created REAL NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, sent REAL)'
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (sent, created)')
+
+    def enqueue(self, key: str, data: dict) -> bool:
+        '''Store one item for delivery; False if an item with this key was already queued or sent'''
+        with self.lock:
+            added = self.conn.execute(
+                'INSERT OR IGNORE INTO outbox (key, data, created) VALUES (?, ?, ?)',
+                [key, json.dumps(data), time.time()]
+            ).rowcount == 1
+        metrics.increment('outbox_enqueued_total' if added else 'outbox_duplicates_total')
+        self.start()
+        return added
+
+    def pending(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT count(*) FROM outbox WHERE sent IS NULL').fetchone()[0]
+
+    def flush(self) -> int:
+        '''Send every pending item, one put_many per batch; returns the number sent. Raises on failure.'''
+        sent = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    'SELECT key, data FROM outbox WHERE sent IS NULL ORDER BY created LIMIT ?', [self.batch_size]
+                ).fetchall()
+            if not rows:
+                return sent
+            keys = [key for key, _ in rows]
+            try:
+                self.collection.put_many([dict(json.loads(data), key=key) for key, data in rows])
+            except Exception:
+                with self.lock:
+                    self.conn.executemany('UPDATE outbox SET attempts = attempts + 1 WHERE key = ?', [[k] for k in keys])
+                raise
+            with self.lock:
+                self.conn.executemany('UPDATE outbox SET sent = ? WHERE key = ?', [[time.time(), k] for k in keys])
+            metrics.increment('outbox_sent_total', len(keys))
+            sent += len(keys)
+
+    def _run(self):
+        failures = 0
+        while True:
+            # Items accumulate for `interval` seconds so they go out together; back off while the backend fails
+            time.sleep(min(self.max_backoff, self.interval * 2 ** failures))
+            try:
+                self.flush()
+                failures = 0
+            except Exception:
+                failures += 1
+                metrics.increment('outbox_failures_total')
+                logger.warning('Outbox flush failed (%d in a row), %d items pending', failures, self.pending(), exc_info=True)
+
+    def start(self):
+        '''Start the background flusher, once per process; items left from a previous run go out first'''
+        if self.worker is not None:
+            return
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, name='outbox', daemon=True)
+                self.worker.start()
+
+
+if __name__ == '__main__':
+    from models import ZipRequest, zip_outbox
+
+    parser = argparse.ArgumentParser(description='Flush queued zipcode requests and show demand per zipcode')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--all', action='store_true', help='Include zipcodes that already have a report')
+    args = parser.parse_args()
+
+    print(f'{zip_outbox.flush()} queued requests sent')
+    for zipcode, count in ZipRequest.get_demand(include_covered=args.all)[:args.top]:
+        print(f'{zipcode}\t{count}')
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+def to_array(values: Sequence) -> np.ndarray:
+    '''Readings arrive as numbers, numeric strings, '' or None; anything non-numeric becomes NaN'''
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+@dataclass
+class Ranking:
+    order: np.ndarray       # indices of the inputs, worst first
+    factor: np.ndarray      # reading / mclg - 1, inf where the health goal is 0
+    mcl_factor: np.ndarray  # reading / mcl - 1, NaN where there is no MCL
+
+
+def exceedance_factors(reading: np.ndarray, standard: np.ndarray) -> np.ndarray:
+    '''reading / standard - 1 with standard == 0 -> inf and missing values -> NaN'''
+    factor = np.full(reading.shape, np.nan)
+    zero = standard == 0
+    factor[zero] = np.inf
+    valid = ~zero & ~np.isnan(standard) & ~np.isnan(reading)
+    np.divide(reading, standard, out=factor, where=valid)
+    factor[valid] -= 1
+    return factor
+
+
+def rank(factor: np.ndarray) -> np.ndarray:
+    '''Indices ordered by descending factor, ties in input order and NaN last'''
+    missing = np.isnan(factor)
+    return np.lexsort((np.arange(len(factor)), -np.where(missing, -np.inf, factor), missing))
+
+
+# Same factor as Primary.__post_init__: max reading (90th percentile when max is missing) relative to the MCLG
+def rank_readings(max_reading: Sequence, perc: Sequence, mclg: Sequence, mcl: Optional[Sequence] = None,
+                  conversion: Optional[Sequence] = None) -> Ranking:
+    max_reading, perc, mclg = to_array(max_reading), to_array(perc), to_array(mclg)
+    mcl = to_array(mcl) if mcl is not None else np.full(len(mclg), np.nan)
+
+    reading = np.where(np.isnan(max_reading), perc, max_reading)
+    if conversion is not None:
+        reading = reading * np.asarray(conversion, dtype=float)
+
+    factor = exceedance_factors(reading, mclg)
+    mcl_factor = exceedance_factors(reading, mcl)
+    # An MCL of 0 means no enforceable limit rather than zero tolerance
+    mcl_factor[mcl == 0] = np.nan
+    return Ranking(order=rank(factor), factor=factor, mcl_factor=mcl_factor)
+
+
+# Worst factor per group (e.g. pwsid) across a flat array of readings, worst group first
+def leaderboard(groups: Sequence, factor: np.ndarray, top: Optional[int] = None) -> list[tuple]:
+    labels, inverse = np.unique(np.asarray(groups), return_inverse=True)
+    worst = np.full(len(labels), -np.inf)
+    np.fmax.at(worst, inverse, factor)
+    # Groups with no comparable reading rank last
+    worst[np.isneginf(worst)] = np.nan
+    order = rank(worst)
+    if top is not None:
+        order = order[:top]
+    labels = labels.tolist()
+    return [(labels[i], float(worst[i])) for i in order]
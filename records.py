@@ -0,0 +1,166 @@
+from dataclasses import dataclass, asdict, fields
+from typing import Iterator, Optional
+import sys
+import threading
+
+import numpy as np
+
+from models import Contaminant, ContaminantReading
+from ranking import to_array
+from units import VALUE_FIELDS
+
+
+@dataclass(frozen=True, slots=True)
+class ContaminantRecord:
+    name: str
+    alt_names: tuple[str, ...]
+    standard: str
+    type: str
+    units: str
+    AC: bool = False
+    RO: bool = False
+    Ion: bool = False
+    mclg: float = np.nan
+    mcl: float = np.nan
+    risk: Optional[str] = None
+    source: Optional[str] = None
+    rul: Optional[str] = None
+    effects: Optional[str] = None
+
+    @staticmethod
+    def from_contaminant(contaminant: Contaminant) -> 'ContaminantRecord':
+        values = asdict(contaminant)
+        values['alt_names'] = tuple(values['alt_names'] or ())
+        return ContaminantRecord(**values)
+
+    def to_contaminant(self) -> Contaminant:
+        values = {f.name: getattr(self, f.name) for f in fields(self)}
+        values['alt_names'] = list(self.alt_names)
+        return Contaminant(**values)
+
+
+class ContaminantPool:
+    '''Interns one ContaminantRecord (and one Contaminant) per name; readings refer to them by integer id.
+
+    Records never change once interned, so use one pool per job (one catalog load), not one per process.
+    '''
+
+    __slots__ = ('records', 'contaminants', 'ids', 'lock')
+
+    def __init__(self):
+        self.records = []
+        self.contaminants = []
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def intern(self, contaminant: Contaminant) -> int:
+        cont_id = self.ids.get(contaminant.name)
+        if cont_id is None:
+            with self.lock:
+                cont_id = self.ids.get(contaminant.name)
+                if cont_id is None:
+                    cont_id = len(self.records)
+                    self.records.append(ContaminantRecord.from_contaminant(contaminant))
+                    self.contaminants.append(contaminant)
+                    self.ids[contaminant.name] = cont_id
+        return cont_id
+
+    def __getitem__(self, cont_id: int) -> ContaminantRecord:
+        return self.records[cont_id]
+
+    def __len__(self):
+        return len(self.records)
+
+
+@dataclass(frozen=True, slots=True)
+class ReadingRecord:
+    year: int
+    origin: str
+    contaminant_id: int
+    units: str
+    max: float = np.nan
+    min: float = np.nan
+    annual_avg: float = np.nan
+    lraa: float = np.nan
+    raa: float = np.nan
+    ninetieth_perc: float = np.nan
+    violation: float = np.nan
+    sample_num: float = np.nan
+
+
+# Float columns; missing and non-numeric values ('' in CCR data) are stored as NaN
+NUMERIC_FIELDS = VALUE_FIELDS + ['violation', 'sample_num']
+
+
+class ReadingTable:
+    '''Struct-of-arrays for many ContaminantReadings (e.g. a whole utility-year).
+
+    Contaminants are stored once in a shared ContaminantPool and referenced by id.
+    '''
+
+    __slots__ = ['pool', 'year', 'origin', 'contaminant_id', 'units'] + NUMERIC_FIELDS
+
+    def __init__(self, pool: ContaminantPool, year: np.ndarray, origin: np.ndarray,
+                 contaminant_id: np.ndarray, units: np.ndarray, **columns: np.ndarray):
+        self.pool = pool
+        self.year = year
+        self.origin = origin
+        self.contaminant_id = contaminant_id
+        self.units = units
+        for name in NUMERIC_FIELDS:
+            setattr(self, name, columns[name])
+        # Tables are shared between sessions without copying, so keep them read-only
+        for name in self.__slots__[1:]:
+            getattr(self, name).flags.writeable = False
+
+    @staticmethod
+    def from_readings(readings: list[ContaminantReading], pool: Optional[ContaminantPool] = None) -> 'ReadingTable':
+        pool = pool if pool is not None else ContaminantPool()
+        columns = {name: to_array([getattr(each, name) for each in readings]) for name in NUMERIC_FIELDS}
+        return ReadingTable(
+            pool,
+            year=np.array([each.year for each in readings], dtype=np.int32),
+            origin=np.array([sys.intern(each.origin) for each in readings], dtype=object),
+            contaminant_id=np.array([pool.intern(each.contaminant) for each in readings], dtype=np.int32),
+            units=np.array([sys.intern(each.units or '') for each in readings], dtype=object),
+            **columns
+        )
+
+    def __len__(self):
+        return len(self.year)
+
+    def __getitem__(self, i: int) -> ReadingRecord:
+        return ReadingRecord(
+            year=int(self.year[i]),
+            origin=self.origin[i],
+            contaminant_id=int(self.contaminant_id[i]),
+            units=self.units[i],
+            **{name: float(getattr(self, name)[i]) for name in NUMERIC_FIELDS}
+        )
+
+    def records(self) -> Iterator[ReadingRecord]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def contaminant(self, i: int) -> ContaminantRecord:
+        return self.pool[int(self.contaminant_id[i])]
+
+    def to_readings(self) -> list[ContaminantReading]:
+        '''ContaminantReadings sharing one Contaminant instance per contaminant'''
+        readings = []
+        for record in self.records():
+            values = {name: getattr(record, name) for name in NUMERIC_FIELDS}
+            readings.append(ContaminantReading(
+                year=record.year,
+                origin=record.origin,
+                contaminant=self.pool.contaminants[record.contaminant_id],
+                units=record.units,
+                **values
+            ))
+        return readings
+
+    def nbytes(self) -> int:
+        arrays = [self.year, self.contaminant_id] + [getattr(self, name) for name in NUMERIC_FIELDS]
+        # object columns hold pointers to interned strings
+        return sum(each.nbytes for each in arrays) + self.origin.nbytes + self.units.nbytes
+
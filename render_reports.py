@@ -0,0 +1,64 @@
+'''Pre-render reports to a static site.
+
+    python render_reports.py [PWSID ...] [--out site] [--format json html] [--workers 4]
+
+Renders every utility when no pwsid is given. Writes <pwsid>.json / <pwsid>.html and an
+index.json mapping each "city state, zip" territory to its pwsid.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import os
+
+from models import WaterUtility
+from report import get_report, render_html
+
+
+def render(pwsid: str, out: str, formats: list[str]) -> tuple[str, list[str], str]:
+    '''Runs in a worker process; returns (pwsid, territories, error)'''
+    try:
+        wutility = WaterUtility.get_by_pwsid(pwsid)
+        if wutility is None:
+            return pwsid, [], 'Unknown pwsid'
+        report = get_report(wutility)
+        if 'json' in formats:
+            Path(out, f'{pwsid}.json').write_text(json.dumps(report.to_dict(), allow_nan=False))
+        if 'html' in formats:
+            Path(out, f'{pwsid}.html').write_text(render_html(report))
+        return pwsid, wutility.territory, None
+    except Exception as e:
+        return pwsid, [], repr(e)
+
+
+def render_all(pwsids: list[str], out: str, formats: list[str], workers: int) -> dict[str, str]:
+    '''Renders reports in parallel; returns errors by pwsid'''
+    Path(out).mkdir(parents=True, exist_ok=True)
+    territories, errors = {}, {}
+    # Spawned, not forked: SQLite connections already open in this process must not cross a fork
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(render, pwsid, out, formats) for pwsid in pwsids]
+        for future in futures:
+            pwsid, territory_lst, error = future.result()
+            if error:
+                errors[pwsid] = error
+            for territory in territory_lst:
+                territories[territory] = pwsid
+    Path(out, 'index.json').write_text(json.dumps(territories, indent=1, sort_keys=True))
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render water reports to static JSON/HTML')
+    parser.add_argument('pwsids', nargs='*')
+    parser.add_argument('--out', default='site')
+    parser.add_argument('--format', nargs='+', choices=['json', 'html'], default=['json', 'html'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    pwsids = args.pwsids or [each for each in WaterUtility.get_all_pwsid() if each]
+    errors = render_all(pwsids, args.out, args.format, args.workers)
+    for pwsid, error in errors.items():
+        print(f'{pwsid}: {error}')
+    print(f'Rendered {len(pwsids) - len(errors)} of {len(pwsids)} reports to {args.out}')
@@ -0,0 +1,173 @@
+from dataclasses import dataclass, asdict
+import html
+import math
+
+from filtration import Recommendation, recommend
+from loader import load_report_data
+from metrics import stage
+from models import WaterUtility, ContaminantReading, Primary, Secondary, report_cache, index
+import trends
+
+# EPA recommended upper limits for the aesthetic metrics shown on the report
+AESTHETIC_LIMITS = {
+    'TDS': 500,
+    'Hardness': 250,
+    'pH': None,
+}
+
+
+@dataclass
+class Report:
+    utility: WaterUtility
+    primary: list[Primary]
+    secondary: dict[str, Secondary]
+    aesthetics: dict[str, dict]
+    filters: dict[str, list[str]]
+    # Smallest filter combination for everything above its health goal
+    recommendation: Recommendation
+    # contaminant -> {year: stats}, see trends.py
+    trends: dict[str, dict[int, dict]]
+
+    def to_dict(self) -> dict:
+        '''JSON-ready report; NaN becomes null and infinite factors (zero health goal) become "inf"'''
+        return {
+            'utility': asdict(self.utility),
+            'primary': [
+                {
+                    'contaminant': each.contaminant.name,
+                    'year': each.year,
+                    'units': each.contaminant.units,
+                    'max_reading': _number(each.max_reading),
+                    'perc': _number(each.perc),
+                    'mclg': _number(each.mclg),
+                    'mcl': _number(each.mcl),
+                    'factor': _number(each.factor),
+                    'filters': self.filters.get(each.contaminant.name, []),
+                }
+                for each in self.primary
+            ],
+            'secondary': {
+                name: {'year': each.year, 'max': _number(each.max), 'rul': each.rul}
+                for name, each in self.secondary.items()
+            },
+            'recommendation': self.recommendation.to_dict(),
+            'trends': {
+                name: {str(year): {key: _number(value) for key, value in stats.items()} for year, stats in years.items()}
+                for name, years in self.trends.items()
+            },
+            'aesthetics': {
+                name: {key: _number(value) for key, value in metric.items()}
+                for name, metric in self.aesthetics.items()
+            },
+        }
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return value if value != '' else None
+    if math.isnan(value):
+        return None
+    if math.isinf(value):
+        return 'inf' if value > 0 else '-inf'
+    return value
+
+
+def build_report(wutility: WaterUtility, readings: list[ContaminantReading] = None, trend_series: dict = None) -> Report:
+    if readings is None:
+        with stage('readings'):
+            readings = ContaminantReading.get_from_db(wutility)
+    if trend_series is None:
+        with stage('trends'):
+            trend_series = trends.get_series(wutility.pwsid)
+    with stage('rank'):
+        primary = WaterUtility.get_primary(readings)
+    with stage('secondary'):
+        secondary = WaterUtility.get_secondary(readings)
+
+    aesthetics = {}
+    for name, limit in AESTHETIC_LIMITS.items():
+        if name not in secondary:
+            continue
+        value = secondary[name].max
+        aesthetics[name] = {
+            'value': value,
+            'delta': int(value) - limit if limit is not None else None,
+        }
+    filters = {each.contaminant.name: each.contaminant.get_filter_rec() for each in primary}
+    return Report(utility=wutility, primary=primary, secondary=secondary, aesthetics=aesthetics, filters=filters,
+                  recommendation=recommend(primary), trends=trend_series)
+
+
+# Return the cached report for the utility's current CCR year, building it on a miss
+def get_report(wutility: WaterUtility, readings: list[ContaminantReading] = None, trend_series: dict = None) -> Report:
+    with stage('report_cache'):
+        report = report_cache.get(wutility.pwsid, wutility.last_updated)
+    if report is None:
+        report = build_report(wutility, readings, trend_series)
+        report_cache.put(wutility.pwsid, wutility.last_updated, report)
+    return report
+
+
+# Report for a "city state, zip" selection: one cache read when warm, concurrent fetches when cold
+def load_report(territory: str) -> Report:
+    pwsid = index.get_pwsid(territory)
+    last_updated = index.get_last_updated(pwsid) if pwsid else None
+    with stage('report_cache'):
+        report = report_cache.get(pwsid, last_updated) if last_updated else None
+    if report is None:
+        with stage('fetch'):
+            data = load_report_data(territory)
+        report = get_report(data.utility, data.readings, data.trends)
+    return report
+
+
+def _markdown_strike(text: str) -> str:
+    # get_filter_rec marks unsuitable methods with markdown strikethrough
+    if text.startswith('~~') and text.endswith('~~'):
+        return f'<s>{html.escape(text[2:-2])}</s>'
+    return html.escape(text)
+
+
+# Static HTML version of the report tab
+def render_html(report: Report) -> str:
+    wutility = report.utility
+    e = html.escape
+    parts = [
+        '<!DOCTYPE html>',
+        '<html><head><meta charset="utf-8">',
+        f'<title>Tap Water Report - {e(wutility.name)} ({wutility.last_updated})</title>',
+        '</head><body>',
+        f'<h1>Tap Water Report ({wutility.last_updated})</h1>',
+        f'<p>Data was sourced from the most recent Consumer Confidence Report (CCR) published by '
+        f'<b>{e(wutility.name)}</b> on {e(str(wutility.publish))}. <a href="{e(wutility.pdf)}">Source</a></p>',
+        f'<p>Serves: {e(", ".join(wutility.territory))}</p>',
+        '<h2>Water Aesthetics</h2><ul>',
+    ]
+    for name, metric in report.aesthetics.items():
+        parts.append(f'<li>{e(name)}: {e(str(metric["value"]))}</li>')
+    parts.append('</ul><h2>Recommended Filtration</h2>')
+    if report.recommendation.methods:
+        parts.append('<ul>' + ''.join(
+            f'<li>{e(method)}: removes {e(", ".join(added))}</li>'
+            for method, added in zip(report.recommendation.methods, report.recommendation.added)
+        ) + '</ul>')
+    else:
+        parts.append('<p>No contaminant above its health goal can be removed by a household filter.</p>')
+    parts.append('<h2>Contaminants Found in Your Water</h2><ol>')
+    for each in report.primary:
+        units = e(each.contaminant.units or '')
+        level = each.max_reading if each.max_reading else each.perc
+        parts += [
+            f'<li><h3>{e(each.contaminant.name)}</h3>',
+            f'<p>Highest Level Detected: {e(str(level))} {units} ({float(each.factor):,.2f}x the EPA Health Goal)</p>',
+            f'<p>EPA Health Goal: {e(str(each.mclg))} {units}; Minimum Contaminant Level: {e(str(each.mcl or "NA"))}</p>',
+            f'<p>Likely Sources: {e(str(each.contaminant.source))}</p>',
+            f'<p>Health Risks: {e(str(each.contaminant.risk))}</p>',
+            '<ul>' + ''.join(f'<li>{_markdown_strike(f)}</li>' for f in report.filters.get(each.contaminant.name, [])) + '</ul>',
+            '</li>',
+        ]
+    parts += ['</ol>', f'<h2>Where does your water come from?</h2><p>{e(str(wutility.supply))}</p>',
+              f'<h2>How your water is treated.</h2><p>{e(str(wutility.treatment))}</p>', '</body></html>']
+    return '\n'.join(parts)
@@ -0,0 +1,50 @@
+from pathlib import Path
+from typing import Optional
+import pickle
+import sqlite3
+import threading
+
+# Bump whenever report.Report changes shape so stale pickles are ignored
+VERSION = 4
+
+
+class ReportCache:
+    '''Materialized reports keyed by (pwsid, last_updated).
+
+    Stored pickled in a SQLite file so they survive restarts and are shared between
+    Streamlit worker processes.
+    '''
+
+    def __init__(self, path: str):
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.lock = threading.Lock()
+        self.table = f'reports_v{VERSION}'
+        with self.lock:
+            if path != ':memory:':
+                self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'pwsid TEXT NOT NULL, last_updated INTEGER NOT NULL, report BLOB NOT NULL, '
+                'PRIMARY KEY (pwsid, last_updated))'
+            )
+
+    def get(self, pwsid: str, last_updated: int) -> Optional[object]:
+        with self.lock:
+            row = self.conn.execute(
+                f'SELECT report FROM {self.table} WHERE pwsid = ? AND last_updated = ?', [pwsid, last_updated]
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, pwsid: str, last_updated: int, report: object):
+        blob = pickle.dumps(report, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.conn.execute(f'INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)', [pwsid, last_updated, blob])
+
+    def invalidate(self, pwsid: Optional[str] = None):
+        with self.lock:
+            if pwsid is None:
+                self.conn.execute(f'DELETE FROM {self.table}')
+            else:
+                self.conn.execute(f'DELETE FROM {self.table} WHERE pwsid = ?', [pwsid])
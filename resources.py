@@ -0,0 +1,80 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+import base64
+import json
+import logging
+import time
+
+import streamlit as st
+
+from models import zip_outbox
+from search import get_search
+from storage import get_backend, setting
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def load_lottiefile(filepath: str):
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+def img_to_bytes(img_path):
+    img_bytes = Path(img_path).read_bytes()
+    encoded = base64.b64encode(img_bytes).decode()
+    return encoded
+
+def img_to_html(img_path):
+    img_html = "<a href='https://waterdoctorusa.com/about'><img src='data:image/png;base64,{}' width='50' class='img-fluid'></a>".format(
+      img_to_bytes(img_path)
+    )
+    return img_html
+
+def read_css(file_name):
+    with open(file_name) as f:
+        return f.read()
+
+
+@dataclass
+class StaticAssets:
+    centered_logo: str
+    lottie: dict
+    css: str
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def _timed(timings: dict, name: str, loader, *args):
+    start = time.perf_counter()
+    value = loader(*args)
+    timings[name] = (time.perf_counter() - start) * 1000
+    return value
+
+
+# Everything the page needs that doesn't change between reruns, loaded once per process
+@st.cache_resource(show_spinner=False)
+def load_static() -> StaticAssets:
+    timings = {}
+    centered_logo = "<p style='text-align: center; color: grey;'>"+_timed(timings, 'logo', img_to_html, 'logo/logo.png')+"</p>"
+    lottie = _timed(timings, 'lottie', load_lottiefile, 'lottie/water_report.json')
+    css = _timed(timings, 'css', read_css, 'css/style.css')
+    _timed(timings, 'backend', get_backend)
+    _timed(timings, 'territories', get_search)
+    # Deliver zipcode requests still queued from a previous run
+    zip_outbox.start()
+
+    # Optional Prometheus scrape endpoint, one per app process
+    if setting('metrics_port'):
+        try:
+            metrics.serve(int(setting('metrics_port')))
+        except OSError:
+            # Only the first app process on the host can bind the port; the others keep serving pages
+            logger.warning('Metrics endpoint not started on port %s', setting('metrics_port'), exc_info=True)
+
+    budget = float(setting('startup_budget_ms', 500))
+    total = sum(timings.values())
+    summary = ', '.join(f'{name}={ms:.1f}ms' for name, ms in timings.items())
+    if total > budget:
+        logger.warning('Startup took %.1fms (budget %.0fms): %s', total, budget, summary)
+    else:
+        logger.info('Startup took %.1fms: %s', total, summary)
+    return StaticAssets(centered_logo=centered_logo, lottie=lottie, css=css, timings=timings)
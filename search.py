@@ -0,0 +1,156 @@
+from typing import Optional
+import logging
+import threading
+import time
+
+from catalog import CatalogSnapshot
+from models import pws_catalog
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.lower().replace(',', ' ').split())
+
+
+class TerritorySearch:
+    '''Prefix trie over "city state, zip" territories with typo-tolerant lookup.
+
+    Every word start is indexed, so "90001", "los ang" and "angeles" all find
+    "Los Angeles CA, 90001".
+    '''
+
+    def __init__(self, territories: list[str]):
+        self.territories = [each for each in territories if each]
+        # node = (children, territory ids ending here)
+        self.root = ({}, [])
+        for territory_id, territory in enumerate(self.territories):
+            words = _normalize(territory).split(' ')
+            for i in range(len(words)):
+                self._add(' '.join(words[i:]), territory_id)
+
+    def _add(self, key: str, territory_id: int):
+        node = self.root
+        for char in key:
+            node = node[0].setdefault(char, ({}, []))
+        node[1].append(territory_id)
+
+    def _collect(self, node, found: dict, distance: int, k: int):
+        '''Add territories under `node` in alphabetical key order until k are found'''
+        stack = [node]
+        while stack and len(found) < k:
+            children, ids = stack.pop()
+            for territory_id in ids:
+                found.setdefault(territory_id, distance)
+            stack.extend(children[char] for char in sorted(children, reverse=True))
+
+    def _fuzzy_prefixes(self, query: str, max_distance: int) -> list[tuple[int, int, object]]:
+        '''Nodes whose path is within max_distance edits of the query.
+
+        Damerau-Levenshtein rows are computed along the trie, so shared prefixes are only scored once
+        and branches that can no longer match are pruned.
+        '''
+        matches = []
+        first_row = list(range(len(query) + 1))
+        stack = [(child, char, first_row, None, '', 1) for char, child in self.root[0].items()]
+        while stack:
+            node, char, previous, before, previous_char, depth = stack.pop()
+            row = [previous[0] + 1]
+            for i in range(1, len(query) + 1):
+                cost = 0 if query[i - 1] == char else 1
+                row.append(min(row[i - 1] + 1, previous[i] + 1, previous[i - 1] + cost))
+                # Swapped neighbouring characters count as one edit
+                if before is not None and i > 1 and query[i - 1] == previous_char and query[i - 2] == char:
+                    row[i] = min(row[i], before[i - 2] + 1)
+            if row[-1] <= max_distance:
+                # The whole query matched; everything below this node is a candidate
+                matches.append((row[-1], depth, node))
+            # Keep descending while a deeper node could still match, or match with fewer edits
+            if min(row) <= max_distance and min(row) < row[-1]:
+                stack.extend((child, c, row, previous, char, depth + 1) for c, child in node[0].items())
+        return matches
+
+    def search(self, query: str, k: int = 10, max_distance: Optional[int] = None) -> list[str]:
+        query = _normalize(query)
+        if not query:
+            return []
+        if max_distance is None:
+            # A mistyped zipcode is usually another real zipcode, so digits must match exactly
+            if query.isdigit() or len(query) < 3:
+                max_distance = 0
+            else:
+                max_distance = 1 if len(query) < 6 else 2
+
+        found = {}
+        # Exact prefixes first, then closest typos; shorter matched prefixes before longer ones
+        for distance, _, node in sorted(self._fuzzy_prefixes(query, max_distance), key=lambda m: (m[0], m[1])):
+            if len(found) >= k:
+                break
+            self._collect(node, found, distance, k)
+        ranked = sorted(found, key=lambda territory_id: found[territory_id])
+        return [self.territories[each] for each in ranked[:k]]
+
+
+def _build(snapshot: CatalogSnapshot) -> TerritorySearch:
+    territories = []
+    for each in snapshot.column('territory'):
+        territories += each or []
+    return TerritorySearch(territories)
+
+
+class SearchIndex:
+    '''The TerritorySearch for a catalog, rebuilt in a background thread when the catalog moves on.
+
+    Only the first build blocks; until a rebuild finishes the previous index keeps being served.
+    A failed rebuild is retried after `retry` seconds.
+    '''
+
+    def __init__(self, catalog: CatalogSnapshot, retry: float = 60.0):
+        self.catalog = catalog
+        self.retry = retry
+        self.lock = threading.Lock()
+        # (catalog version, TerritorySearch)
+        self.current = None
+        self.builder = None
+        self.failed_at = None
+
+    def _build(self) -> tuple[int, TerritorySearch]:
+        version = self.catalog.ensure()
+        return version, _build(self.catalog)
+
+    def _rebuild(self):
+        try:
+            self.current = self._build()
+            self.failed_at = None
+        except Exception:
+            self.failed_at = time.monotonic()
+            logger.warning('Rebuilding the territory search index failed', exc_info=True)
+        finally:
+            self.builder = None
+
+    def get(self) -> TerritorySearch:
+        current = self.current
+        if current is None:
+            with self.lock:
+                if self.current is None:
+                    self.current = self._build()
+            return self.current[1]
+        if not self.catalog.is_current(current[0]):
+            with self.lock:
+                waiting = self.failed_at is not None and time.monotonic() - self.failed_at < self.retry
+                if self.builder is None and not waiting:
+                    self.builder = threading.Thread(target=self._rebuild, name='search-index', daemon=True)
+                    self.builder.start()
+        return current[1]
+
+
+search_index = SearchIndex(pws_catalog)
+
+
+def get_search() -> TerritorySearch:
+    '''Search index over every territory; a reload of the pws catalog is picked up in the background'''
+    return search_index.get()
+
+
+def search_territories(query: str, k: int = 10) -> list[str]:
+    return get_search().search(query, k)
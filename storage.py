@@ -0,0 +1,285 @@
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, Protocol, Union
+import json
+import math
+import os
+import secrets
+import sqlite3
+import threading
+
+import streamlit as st
+
+from metrics import InstrumentedCollection
+
+Query = Union[dict, list[dict]]
+
+# Collections used by models.py and the indexes (fields queried together) each one is looked up by
+COLLECTIONS = {
+    'pws': [('pwsid',)],
+    'contaminants_db': [('name',)],
+    # One utility's readings, for one CCR year or (on the prefix) all of them
+    'readings': [('origin', 'year')],
+    'zip_request': [('zipcode',)],
+    'trends': [('pwsid',)],
+}
+
+
+@dataclass
+class FetchResponse:
+    count: int = 0
+    last: Optional[str] = None
+    items: list[dict] = field(default_factory=list)
+
+
+class Collection(Protocol):
+    '''Subset of the Deta Base API that models.py relies on'''
+
+    def fetch(self, query: Optional[Query] = None, limit: int = 1000, last: Optional[str] = None) -> FetchResponse: ...
+
+    def get(self, key: str) -> Optional[dict]: ...
+
+    def insert(self, data: dict, key: Optional[str] = None) -> dict: ...
+
+    def put(self, data: dict, key: Optional[str] = None) -> dict: ...
+
+    def put_many(self, items: list[dict]) -> dict: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+def fetch_all(collection: Collection, query: Optional[Query] = None, page_size: int = 1000) -> Iterator[dict]:
+    '''Lazily yield every matching item, following the `last` cursor one page at a time'''
+    last = None
+    while True:
+        response = collection.fetch(query, limit=page_size, last=last)
+        yield from response.items
+        last = response.last
+        if not last:
+            return
+
+
+def fetch_first(collection: Collection, query: Optional[Query] = None) -> Optional[dict]:
+    '''First matching item; a filtered page can come back empty while later pages still match'''
+    return next(fetch_all(collection, query), None)
+
+
+class Backend:
+    def collection(self, name: str) -> Collection:
+        raise NotImplementedError
+
+
+class DetaBackend(Backend):
+    def __init__(self, project_key: str):
+        from deta import Deta
+        self.deta = Deta(project_key)
+
+    # deta.Base already implements the Collection interface
+    def collection(self, name: str) -> Collection:
+        return self.deta.Base(name)
+
+
+class SqliteBackend(Backend):
+    '''Stores every collection as a table of JSON documents in one SQLite database (a file or ":memory:")'''
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        if path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.collections = {}
+
+    def collection(self, name: str) -> Collection:
+        if name not in self.collections:
+            self.collections[name] = SqliteCollection(self, name, COLLECTIONS.get(name, []))
+        return self.collections[name]
+
+
+# Query operators understood by Deta Base, translated to SQL
+_OPERATORS = {
+    'ne': '!=',
+    'lt': '<',
+    'gt': '>',
+    'lte': '<=',
+    'gte': '>=',
+}
+
+
+def _path(field_name: str) -> str:
+    return '$.' + field_name
+
+
+def _clean(value):
+    '''SQLite's JSON functions reject NaN, so missing readings are stored as null'''
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    if hasattr(value, 'item'):
+        # numpy scalars
+        return _clean(value.item())
+    return value
+
+
+class SqliteCollection:
+    def __init__(self, backend: SqliteBackend, name: str, indexes: list[tuple[str, ...]]):
+        self.backend = backend
+        self.name = name
+        with backend.lock:
+            backend.conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (key TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            for fields in indexes:
+                columns = ', '.join(f"json_extract(data, '{_path(each)}')" for each in fields)
+                backend.conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{name}_{"_".join(fields)}" ON "{name}" ({columns})')
+
+    def _condition(self, query: dict) -> tuple[str, list]:
+        clauses, params = [], []
+        for name, value in query.items():
+            field_name, _, op = name.partition('?')
+            column = f"json_extract(data, '{_path(field_name)}')"
+            if op == '':
+                value = _clean(value)
+                # `=` lets SQLite use the expression indexes; only null needs IS
+                clauses.append(f'{column} IS NULL' if value is None else f'{column} = ?')
+                if value is not None:
+                    params.append(value)
+            elif op in _OPERATORS:
+                clauses.append(f'{column} {_OPERATORS[op]} ?')
+                params.append(_clean(value))
+            elif op == 'pfx':
+                clauses.append(f'substr({column}, 1, ?) = ?')
+                params += [len(value), value]
+            elif op == 'contains':
+                # Membership for lists, substring for strings (same as Deta)
+                clauses.append(
+                    f"(CASE json_type(data, '{_path(field_name)}') "
+                    f"WHEN 'array' THEN EXISTS (SELECT 1 FROM json_each(data, '{_path(field_name)}') WHERE value = ?) "
+                    f"ELSE instr({column}, ?) > 0 END)"
+                )
+                params += [value, value]
+            else:
+                raise ValueError(f'Unsupported query operator: {name}')
+        return ' AND '.join(clauses) or '1', params
+
+    def fetch(self, query: Optional[Query] = None, limit: int = 1000, last: Optional[str] = None) -> FetchResponse:
+        if query is None:
+            query = [{}]
+        elif isinstance(query, dict):
+            query = [query]
+
+        conditions, params = [], []
+        for each in query:
+            sql, args = self._condition(each)
+            conditions.append(f'({sql})')
+            params += args
+        where = ' OR '.join(conditions)
+        if last is not None:
+            where = f'({where}) AND key > ?'
+            params.append(last)
+
+        # Read one extra row to know whether another page follows
+        with self.backend.lock:
+            rows = self.backend.conn.execute(
+                f'SELECT key, data FROM "{self.name}" WHERE {where} ORDER BY key LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        items = [dict(json.loads(data), key=key) for key, data in rows]
+        return FetchResponse(count=len(items), last=rows[-1][0] if more else None, items=items)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.backend.lock:
+            row = self.backend.conn.execute(f'SELECT data FROM "{self.name}" WHERE key = ?', [key]).fetchone()
+        if row is None:
+            return None
+        return dict(json.loads(row[0]), key=key)
+
+    def _split(self, data: dict, key: Optional[str]) -> tuple[str, dict]:
+        data = _clean(dict(data))
+        key = key or data.pop('key', None) or secrets.token_hex(6)
+        data.pop('key', None)
+        return str(key), data
+
+    def insert(self, data: dict, key: Optional[str] = None) -> dict:
+        key, data = self._split(data, key)
+        with self.backend.lock:
+            try:
+                self.backend.conn.execute(f'INSERT INTO "{self.name}" VALUES (?, ?)', [key, json.dumps(data)])
+            except sqlite3.IntegrityError:
+                raise ValueError(f'Item with key {key} already exists in {self.name}')
+        return dict(data, key=key)
+
+    def put(self, data: dict, key: Optional[str] = None) -> dict:
+        return self.put_many([dict(data, key=key) if key else data])['processed']['items'][0]
+
+    def put_many(self, items: list[dict]) -> dict:
+        stored = [self._split(each, None) for each in items]
+        with self.backend.lock:
+            self.backend.conn.execute('BEGIN')
+            try:
+                self.backend.conn.executemany(
+                    f'INSERT OR REPLACE INTO "{self.name}" VALUES (?, ?)',
+                    [(key, json.dumps(data)) for key, data in stored]
+                )
+                self.backend.conn.execute('COMMIT')
+            except Exception:
+                self.backend.conn.execute('ROLLBACK')
+                raise
+        return {'processed': {'items': [dict(data, key=key) for key, data in stored]}}
+
+    def delete(self, key: str) -> None:
+        with self.backend.lock:
+            self.backend.conn.execute(f'DELETE FROM "{self.name}" WHERE key = ?', [key])
+
+
+def setting(name: str, default=None):
+    '''Environment variables (upper case) override .streamlit/secrets.toml'''
+    if name.upper() in os.environ:
+        return os.environ[name.upper()]
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError:
+        return default
+
+
+# Select the backend with `backend = "deta" | "sqlite"` (and `sqlite_path`) in secrets.toml
+def create_backend() -> Backend:
+    kind = setting('backend', 'deta')
+    if kind == 'deta':
+        return DetaBackend(setting('deta_key'))
+    if kind == 'sqlite':
+        return SqliteBackend(setting('sqlite_path', ':memory:'))
+    raise ValueError(f'Unknown storage backend: {kind}')
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+# The configured backend, created on first use and shared by the whole process
+def get_backend() -> Backend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+class LazyCollection:
+    '''Resolves the named collection on first use, so importing models doesn't open a backend client'''
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collection = None
+
+    def resolve(self) -> Collection:
+        if self._collection is None:
+            self._collection = InstrumentedCollection(get_backend().collection(self.name), self.name)
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
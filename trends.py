@@ -0,0 +1,113 @@
+'''Year-over-year statistics per utility and contaminant, maintained as readings are written.
+
+One document per (pwsid, contaminant) in the `trends` collection holds a running aggregate for
+every CCR year, so trend charts read a handful of small documents instead of every reading.
+
+    python trends.py [PWSID ...]    # rebuild from stored readings (all utilities by default)
+'''
+import argparse
+import math
+import threading
+
+from ranking import exceedance_factors, to_array
+from storage import LazyCollection, fetch_all
+from units import reported_levels
+
+trend_db = LazyCollection('trends')
+# Read-modify-write of a trend document is serialized within the process
+_lock = threading.Lock()
+
+
+def _key(pwsid: str, contaminant: str) -> str:
+    return f'{pwsid}|{contaminant}'
+
+
+def _empty_year() -> dict:
+    return {'max': None, 'sum': 0.0, 'count': 0, 'avg': None, 'factor': None, 'violations': 0}
+
+
+def _add(year_stats: dict, value: float, violation, mclg: float):
+    if not math.isnan(value):
+        year_stats['max'] = value if year_stats['max'] is None else max(year_stats['max'], value)
+        year_stats['sum'] += value
+        year_stats['count'] += 1
+        year_stats['avg'] = year_stats['sum'] / year_stats['count']
+    try:
+        year_stats['violations'] += int(violation or 0)
+    except (TypeError, ValueError):
+        pass
+    if year_stats['max'] is not None:
+        factor = float(exceedance_factors(to_array([year_stats['max']]), to_array([mclg]))[0])
+        # JSON has no infinity; a zero health goal is stored as "inf" like Report.to_dict does
+        year_stats['factor'] = None if math.isnan(factor) else 'inf' if math.isinf(factor) else factor
+
+
+def _values(rows: list[dict], lookup: dict) -> list[tuple]:
+    '''(pwsid, contaminant, year, value in catalog units, violation, mclg) for each resolvable row'''
+    resolved = [lookup.get(row['contaminant']) for row in rows]
+    keep = [(row, cont) for row, cont in zip(rows, resolved) if cont is not None]
+    if not keep:
+        return []
+    values = reported_levels([row for row, _ in keep], [cont.units for _, cont in keep])
+    return [
+        (row['origin'], cont.name, str(row['year']), float(value), row.get('violation'), cont.mclg)
+        for (row, cont), value in zip(keep, values)
+    ]
+
+
+# Fold new reading rows into their trend documents; one get per touched document and one put_many
+def record_many(rows: list[dict], lookup: dict):
+    grouped = {}
+    for pwsid, name, year, value, violation, mclg in _values(rows, lookup):
+        grouped.setdefault(_key(pwsid, name), []).append((pwsid, name, year, value, violation, mclg))
+
+    with _lock:
+        docs = []
+        for key, items in grouped.items():
+            pwsid, name = items[0][0], items[0][1]
+            doc = trend_db.get(key) or {'key': key, 'pwsid': pwsid, 'contaminant': name, 'years': {}}
+            for _, _, year, value, violation, mclg in items:
+                _add(doc['years'].setdefault(year, _empty_year()), value, violation, mclg)
+            docs.append(doc)
+        for i in range(0, len(docs), 25):
+            trend_db.put_many(docs[i:i + 25])
+
+
+def record(row: dict, lookup: dict):
+    record_many([row], lookup)
+
+
+def _read_year(stats: dict) -> dict:
+    if stats.get('factor') is not None:
+        stats = dict(stats, factor=float(stats['factor']))
+    return stats
+
+
+# contaminant -> {year: stats} for one utility, in one query
+def get_series(pwsid: str) -> dict[str, dict[int, dict]]:
+    series = {}
+    for doc in fetch_all(trend_db, {'pwsid': pwsid}):
+        series[doc['contaminant']] = {int(year): _read_year(stats) for year, stats in sorted(doc['years'].items())}
+    return series
+
+
+def rebuild(pwsid: str, rows: list[dict], lookup: dict):
+    '''Replace a utility's trend documents with aggregates of `rows` (all of its readings)'''
+    with _lock:
+        for doc in fetch_all(trend_db, {'pwsid': pwsid}):
+            trend_db.delete(doc['key'])
+    record_many(rows, lookup)
+
+
+if __name__ == '__main__':
+    from models import Contaminant, WaterUtility, readings
+
+    parser = argparse.ArgumentParser(description='Rebuild trend aggregates from stored readings')
+    parser.add_argument('pwsids', nargs='*')
+    args = parser.parse_args()
+
+    lookup = Contaminant.get_lookup()
+    pwsids = args.pwsids or [each for each in WaterUtility.get_all_pwsid() if each]
+    for pwsid in pwsids:
+        rebuild(pwsid, list(fetch_all(readings, {'origin': pwsid})), lookup)
+    print(f'Rebuilt trends for {len(pwsids)} utilities')
@@ -0,0 +1,122 @@
+from dataclasses import replace
+from typing import Sequence
+
+import numpy as np
+
+from ranking import to_array
+
+# unit -> (quantity, scale relative to the quantity's base unit, full name)
+UNITS = {
+    'ppm': ('concentration', 1.0, 'parts per million'),
+    'ppb': ('concentration', 1e-3, 'parts per billion'),
+    'ppt': ('concentration', 1e-6, 'parts per trillion'),
+    'mg/L': ('concentration', 1.0, 'milligrams per liter'),
+    'µg/L': ('concentration', 1e-3, 'micrograms per liter'),
+    'ng/L': ('concentration', 1e-6, 'nanograms per liter'),
+    'gpg': ('concentration', 17.118, 'grains per gallon'),
+    'pCi/L': ('radioactivity', 1.0, 'picocuries per liter'),
+    'mrem/yr': ('dose', 1.0, 'millirems per year'),
+    'NTU': ('turbidity', 1.0, 'nephelometric turbidity units'),
+    'MFL': ('fibers', 1.0, 'million fibers per liter'),
+    'µS/cm': ('conductivity', 1.0, 'microsiemens per centimeter'),
+    'TON': ('odor', 1.0, 'threshold odor number'),
+    'CU': ('color', 1.0, 'color units'),
+}
+
+# Spellings found in CCRs -> canonical unit
+ALIASES = {
+    'mg/l': 'mg/L',
+    'ug/L': 'µg/L',
+    'ug/l': 'µg/L',
+    'μg/L': 'µg/L',
+    'μg/l': 'µg/L',
+    'µg/l': 'µg/L',
+    'ng/l': 'ng/L',
+    'pci/L': 'pCi/L',
+    'pci/l': 'pCi/L',
+    'grains/gal': 'gpg',
+    'ntu': 'NTU',
+    'umhos/cm': 'µS/cm',
+    'µmhos/cm': 'µS/cm',
+    'uS/cm': 'µS/cm',
+}
+
+# Reading fields holding measured values
+VALUE_FIELDS = ['max', 'min', 'annual_avg', 'lraa', 'raa', 'ninetieth_perc']
+
+_INDEX = {unit: i for i, unit in enumerate(UNITS)}
+
+
+def _conversion_matrix() -> np.ndarray:
+    '''matrix[i, j] multiplies a value in unit i into unit j; NaN between different quantities'''
+    quantity = np.array([each[0] for each in UNITS.values()])
+    scale = np.array([each[1] for each in UNITS.values()])
+    matrix = scale[:, None] / scale[None, :]
+    matrix[quantity[:, None] != quantity[None, :]] = np.nan
+    return matrix
+
+
+CONVERSION = _conversion_matrix()
+
+
+def canonical(unit) -> str:
+    unit = (unit or '').strip()
+    return ALIASES.get(unit, unit)
+
+
+def unit_name(unit) -> str:
+    unit = canonical(unit)
+    return UNITS[unit][2] if unit in UNITS else ''
+
+
+def conversion_factors(from_units: Sequence, to_units: Sequence) -> np.ndarray:
+    '''Element-wise factors; 1 for identical units, NaN for unknown or incompatible ones'''
+    from_units = [canonical(each) for each in from_units]
+    to_units = [canonical(each) for each in to_units]
+    i = np.array([_INDEX.get(each, -1) for each in from_units], dtype=int)
+    j = np.array([_INDEX.get(each, -1) for each in to_units], dtype=int)
+    known = (i >= 0) & (j >= 0)
+    factors = np.full(len(i), np.nan)
+    factors[known] = CONVERSION[i[known], j[known]]
+    factors[np.array([a == b for a, b in zip(from_units, to_units)], dtype=bool)] = 1.0
+    return factors
+
+
+def convert(values: Sequence, from_units: Sequence, to_units: Sequence) -> np.ndarray:
+    return to_array(values) * conversion_factors(from_units, to_units)
+
+
+# Highest level each raw reading row reports, converted to `to_units`
+def reported_levels(rows: list[dict], to_units: Sequence) -> np.ndarray:
+    '''The max, falling back to the 90th percentile like Primary does; NaN if neither is usable'''
+    values = to_array([row.get('max') for row in rows])
+    missing = np.isnan(values)
+    values[missing] = to_array([row.get('ninetieth_perc') for row in rows])[missing]
+    return values * conversion_factors([row.get('units') for row in rows], to_units)
+
+
+# Return copies of the readings with every value field in its contaminant's units
+def calibrate(readings: list) -> list:
+    '''Readings whose units can't be converted, and non-numeric values such as '', are left as they are'''
+    if not readings:
+        return []
+    factors = conversion_factors([each.units for each in readings], [each.contaminant.units for each in readings])
+    convertible = ~np.isnan(factors) & (factors != 1)
+
+    columns = {}
+    for name in VALUE_FIELDS:
+        original = [getattr(each, name) for each in readings]
+        converted = to_array(original) * factors
+        columns[name] = [
+            float(new) if convertible[i] and not np.isnan(new) else original[i]
+            for i, new in enumerate(converted)
+        ]
+
+    calibrated = []
+    for i, each in enumerate(readings):
+        if not convertible[i]:
+            calibrated.append(each)
+            continue
+        changes = {name: columns[name][i] for name in VALUE_FIELDS}
+        calibrated.append(replace(each, units=each.contaminant.units, **changes))
+    return calibrated
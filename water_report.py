@@ -1,7 +1,9 @@
-from models import WaterUtility, ContaminantReading, ZipRequest
-import json
-import base64
-from pathlib import Path
+from analytics import national
+from models import ZipRequest
+from report import load_report
+from resources import load_static
+from search import search_territories
+import metrics
 
 import pandas as pd
 import streamlit as st
@@ -11,24 +13,8 @@ from streamlit_extras.colored_header import colored_header
 from annotated_text import annotated_text
 from streamlit_lottie import st_lottie
 
-def load_lottiefile(filepath: str):
-    with open(filepath, 'r') as f:
-        return json.load(f)
-
-def img_to_bytes(img_path):
-    img_bytes = Path(img_path).read_bytes()
-    encoded = base64.b64encode(img_bytes).decode()
-    return encoded
-
-def img_to_html(img_path):
-    img_html = "<a href='https://waterdoctorusa.com/about'><img src='data:image/png;base64,{}' width='50' class='img-fluid'></a>".format(
-      img_to_bytes(img_path)
-    )
-    return img_html
-
-def local_css(file_name):
-    with open(file_name) as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+def local_css(css):
+    st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
 
 
 # ------- PAGE CONFIG -------
@@ -44,11 +30,11 @@ st.set_page_config(
 
 # -------- SETTINGS --------
 vert_space = '<div style="padding: 10px 5px;"></div>'
-territories = WaterUtility.get_all()
+static = load_static()
 logo = 'https://lh4.googleusercontent.com/r_DvVzF2wmpBC3ZVQBlofpveBTkLTNPWE8RBFhQvSw571RLyf4e5i8fF6nYsnGY4mNM=w2400'
-centered_logo = "<p style='text-align: center; color: grey;'>"+img_to_html('logo/logo.png')+"</p>"
+centered_logo = static.centered_logo
 by_wd = 'https://lh5.googleusercontent.com/V-DcILHJebKcQO9vRDkr45ALqKNYwfoutn-LOyS9Hcv1ysjetx3J7ltuQ2Ua3EEs53Q=w2400'
-lottie = load_lottiefile('lottie/water_report.json')
+lottie = static.lottie
 # Removes border on all streamlit forms
 css = r'''
         <style>
@@ -56,47 +42,87 @@ css = r'''
         </style>
     '''
 st.markdown(css, unsafe_allow_html=True)
+local_css(static.css)
 
 
 
 
 # ----------------------------- FUNCTIONS -----------------------------
-def get_contaminants(cont_list, count=1):
-    count = count
+# Yearly highest level against the health goal, for utilities with more than one CCR year on file
+def trend_chart(each, history):
+    years = list(history)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=years, y=[history[year]['max'] for year in years], mode='lines+markers', name='Highest Level'))
+    fig.add_trace(go.Scatter(x=years, y=[each.mclg] * len(years), mode='lines', name='EPA Health Goal', line={'dash': 'dash'}))
+    fig.update_layout(height=250, margin={'l': 0, 'r': 0, 't': 10, 'b': 0}, xaxis={'type': 'category'},
+                      yaxis_title=each.contaminant.units, legend={'orientation': 'h'})
+    return fig
+
+
+def contaminant_details(each, history=None, ranks=None):
+    #fig = gauge(each)
+    #st.plotly_chart(fig, use_container_width=True)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(label=":red[Highest Level Detected]", value=f"{each.max_reading if each.max_reading else each.perc} {each.contaminant.units}", delta=f"{'{:,.2f}'.format(float(each.factor))}x", delta_color='inverse')
+    with col2:
+        st.metric(label='EPA Health Goal', value=f'{each.mclg} {each.contaminant.units}', help='Level of a contaminant in drinking water below which there is no known or expected health risk')
+    with col3:
+        na = 'NA'
+        empty= ''
+        st.metric(label='Minimum Contaminant Level', value=f'{each.mcl if each.mcl else na} {each.contaminant.units if each.mcl else empty}', help='Level of a contaminant that Water Utilities cannot exceed')
+
+    if ranks:
+        st.caption(f"Higher than {ranks['state']:.0%} of utilities in your state and {ranks['nation']:.0%} nationwide that reported {each.contaminant}")
+
+    if history and len(history) > 1:
+        st.markdown(vert_space, unsafe_allow_html=True)
+        annotated_text(('Year over Year', f'{each.contaminant}','rgba(28, 131, 225, .33)'))
+        st.plotly_chart(trend_chart(each, history), use_container_width=True)
+
+    st.markdown(vert_space, unsafe_allow_html=True)
+    annotated_text(('Likely Sources', f'{each.contaminant}','rgba(28, 131, 225, .33)'))
+    st.write(f"{each.contaminant.source}")
+
+    st.markdown(vert_space, unsafe_allow_html=True)
+    annotated_text(('Health Risks', f'{each.contaminant}','rgba(28, 131, 225, .33)'))
+    st.write(f"{each.contaminant.risk}")
+
+    st.markdown(vert_space, unsafe_allow_html=True)
+    annotated_text(('Recommended Filtration Method', f'{each.contaminant}','rgba(28, 131, 225, .33)'))
+    filter_list = each.contaminant.get_filter_rec()
+
+    for f in filter_list:
+        st.markdown(f'- {f}')
+
+
+def recommendation_text(recommendation):
+    if not recommendation.methods:
+        return "None of the contaminants above their health goal in your water can be removed by a household filter, so there's no filter we'd recommend for them."
+    steps = [f"**{method}** (removes {', '.join(added)})" for method, added in zip(recommendation.methods, recommendation.added)]
+    text = f"Based on your water, we recommend {' combined with '.join(steps)}. Together they remove {len(recommendation.covered)} of the {len(recommendation.covered) + len(recommendation.uncovered)} contaminants above their health goal."
+    if recommendation.uncovered:
+        text += f" No household filter removes {', '.join(recommendation.uncovered)}."
+    return text
+
+
+# Only the summary line is rendered up front; opening it reruns just this fragment to build the details
+@st.fragment
+def contaminant_summary(each, count, history=None, ranks=None):
     pfas = '(Forever Chemicals)'
-    for each in cont_list:
-        local_css("css/style.css")
-        with st.expander(f"**{count}. {each.contaminant}** {pfas if each.contaminant.name in ['PFOS', 'PFOA'] else ''}"):
-            #fig = gauge(each)
-            #st.plotly_chart(fig, use_container_width=True)
+    label = f"**{count}. {each.contaminant}** {pfas if each.contaminant.name in ['PFOS', 'PFOA'] else ''}"
+    if st.toggle(label, key=f'details-{count}'):
+        with st.container(border=True):
+            contaminant_details(each, history, ranks)
+    st.markdown(vert_space, unsafe_allow_html=True)
 
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric(label=":red[Highest Level Detected]", value=f"{each.max_reading if each.max_reading else each.perc} {each.contaminant.units}", delta=f"{'{:,.2f}'.format(float(each.factor))}x", delta_color='inverse')
-            with col2:
-                st.metric(label='EPA Health Goal', value=f'{each.mclg} {each.contaminant.units}', help='Level of a contaminant in drinking water below which there is no known or expected health risk')
-            with col3:
-                na = 'NA'
-                empty= ''
-                st.metric(label='Minimum Contaminant Level', value=f'{each.mcl if each.mcl else na} {each.contaminant.units if each.mcl else empty}', help='Level of a contaminant that Water Utilities cannot exceed')
-            
-            st.markdown(vert_space, unsafe_allow_html=True)
-            annotated_text(('Likely Sources', f'{each.contaminant}','rgba(28, 131, 225, .33)'))
-            st.write(f"{each.contaminant.source}")
-            
-            st.markdown(vert_space, unsafe_allow_html=True)
-            annotated_text(('Health Risks', f'{each.contaminant}','rgba(28, 131, 225, .33)'))
-            st.write(f"{each.contaminant.risk}")
-            
-            st.markdown(vert_space, unsafe_allow_html=True)
-            annotated_text(('Recommended Filtration Method', f'{each.contaminant}','rgba(28, 131, 225, .33)'))
-            filter_list = each.contaminant.get_filter_rec()
 
-            for f in filter_list:
-                st.markdown(f'- {f}')
-            
-            count += 1
-            st.markdown(vert_space, unsafe_allow_html=True)
+def get_contaminants(cont_list, count=1, trends=None, ranks=None):
+    for each in cont_list:
+        name = each.contaminant.name
+        contaminant_summary(each, count, (trends or {}).get(name), (ranks or {}).get(name))
+        count += 1
 
 
 # -------------------------------- APP --------------------------------
@@ -109,162 +135,185 @@ st.markdown(vert_space, unsafe_allow_html=True)
 main_title = '<h1 style="text-align:center">Enter your zipcode</h1>'
 st.markdown(main_title, unsafe_allow_html=True)
 st.markdown(vert_space, unsafe_allow_html=True)
-city_state_zip = st.selectbox('Enter your Zipcode', territories, label_visibility='collapsed')
+# Search server-side instead of shipping every territory to the browser
+query = st.text_input('Enter your Zipcode', placeholder='Zipcode or city', label_visibility='collapsed')
+matches = search_territories(query) if query else []
+city_state_zip = None
+if len(matches) == 1:
+    city_state_zip = matches[0]
+elif matches:
+    city_state_zip = st.selectbox('Select your city', [''] + matches, label_visibility='collapsed')
 
 if city_state_zip:
     
-    wutility = WaterUtility.get_from_db(city_state_zip)
-    st.title(f'Tap Water Report ({wutility.last_updated})')
-    colored_header(
-        label=f'*{city_state_zip}*',
-        description=f'Data was sourced from the most recent Consumer Confidence Report (CCR) published by :blue[{wutility.name}] on {wutility.publish}. [Source]({wutility.pdf})',
-        color_name='blue-70'
-    )
-    tab1, tab2, tab3 = st.tabs(['Report', 'Water Source', 'FAQs'])
-    with tab1:
-        readings = ContaminantReading.get_from_db(wutility)
-        # Get top 5 contaminants
-        primary_cont = WaterUtility.get_primary(readings)
-        secondary_cont = WaterUtility.get_secondary(readings)
-        
-        # TODO: Also a clear label whether it's good, okay, or bad. Maybe a 5-star rating based on relative performance? or absolute performance?
-        st.subheader('Water Aesthetics')
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            tds = secondary_cont['TDS']
-            st.metric(label='TDS', value=tds.max, delta=f'{int(tds.max)-500}', delta_color='inverse', help='Total Dissolved Solids should be below **500** as recommended by EPA')
-        with col2:
-            hardness = secondary_cont['Hardness']
-            st.metric(label='Hardness', value=hardness.max, delta=f'{int(hardness.max)-250}', delta_color='inverse', help='Hardness should be below **250** as recommended by EPA')
-        with col3:
-            ph = secondary_cont['pH']
-            st.metric(label='pH', value=ph.max, help='pH levels should be between **6.5 - 8.5** as recommended by EPA')
-        st.markdown(
-            '''
-            
-            '''
+    with metrics.trace('report_view', territory=city_state_zip) as view:
+        # Utility, readings and catalog are fetched concurrently (or served from the report cache)
+        report = load_report(city_state_zip)
+        wutility = report.utility
+        st.title(f'Tap Water Report ({wutility.last_updated})')
+        colored_header(
+            label=f'*{city_state_zip}*',
+            description=f'Data was sourced from the most recent Consumer Confidence Report (CCR) published by :blue[{wutility.name}] on {wutility.publish}. [Source]({wutility.pdf})',
+            color_name='blue-70'
         )
-        st.caption(':blue[TDS] A measure of how much solid particles (dirt, sand, minerals, bacteria, etc.) are present in the water.')
-        st.caption(':blue[Hardness] A measure of how much Magnesium and Calcium are present in the water. The white residue or spots that you see on your glassware is from hard water.')
-        
-        # TODO: Other secondary contaminants that have aesthetic effects on water
-        '---'
-
-
-        # -------- TOP 5 CONTAMINANTS --------
-        st.header('Top 5 Contaminants Found in Your Water')
-        st.info(
-            """
-            The contaminants listed here are only a handful of contaminants found in your water.
-            There are many more that go untested.
-            """,
-            icon='👀'
-        )
-        get_contaminants(primary_cont[:5])
-        
-        placeholder = st.empty()
-        # -------- SHOW REST OF THE LIST --------
-        if placeholder.button('More...'):
-            with placeholder.container():
-                get_contaminants(primary_cont[5:], 6)
-        
-        '---'
-        st.caption(":blue[Minimum Contaminant Level Goal (MCLG)] A measure set by the EPA based on health effects data, it's the maximum level of a contaminant in drinking water at which no known or anticipated adverse effect on the health of persons would occur, allowing an adequate margin of safety. Note: _MCLG_ and _MRDLG (Minimum Residual Disinfectant Level Goal)_ is used interchangeably in this report.")
-        st.caption(":blue[Minimum Contaminant Level (MCL)] The maximum level allowed of a contaminant in water which is delivered to any user of a public water system strictly based on technical feasibility of treatment. Note: _MCL_ and _MRDL (Minimum Residual Disinfectant Level)_ is used interchangeably in this report.")
-    
-    # -------- ADDITIONAL INFO --------
-    with tab2:
-
-        # two pie charts of contaminants exceeding health standards and mcl
-        
-        # Water Supply
-        st.header('Where does your water come from?')
-        st.write(f'{wutility.supply}')
-
-        # Treatment Process
-        st.subheader('How your water is treated.')
-        st.write(f'{wutility.treatment}')
-    
-    with tab3:
-        st.info(
-            f"""
-            All contaminants, public health goals and minimum contaminant level standards in this 
-            report was sourced from the [EPA](https://www.epa.gov/ground-water-and-drinking-water/national-primary-drinking-water-regulations) 
-            and the latest Consumer Confidence Report ([CCR]({wutility.pdf})) that your
-            local water utility is required to publish annually.
-            """,
-            icon='ℹ️'
-        )
-        st.header('Frequently Asked Questions')
-        with st.expander('**How accurate and reliable are the reported figures?**'):
+        tab1, tab2, tab3 = st.tabs(['Report', 'Water Source', 'FAQs'])
+        with tab1, metrics.stage('render'):
+            # Get top 5 contaminants
+            primary_cont = report.primary
+            
+            # Relative to every other utility's latest CCR, precomputed nationwide
+            rating = national.rating(wutility.pwsid)
+            ranks = national.percentiles(wutility.pwsid)
+            if rating:
+                st.subheader(f"{'★' * rating['stars']}{'☆' * (5 - rating['stars'])} {rating['label']}")
+                st.caption(f"Cleaner than {rating['cleaner_than_state']:.0%} of utilities in your state and {rating['cleaner_than_nation']:.0%} nationwide, based on how each contaminant ranks against every utility that reported it.")
+            st.subheader('Water Aesthetics')
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                tds = report.aesthetics['TDS']
+                st.metric(label='TDS', value=tds['value'], delta=f"{tds['delta']}", delta_color='inverse', help='Total Dissolved Solids should be below **500** as recommended by EPA')
+            with col2:
+                hardness = report.aesthetics['Hardness']
+                st.metric(label='Hardness', value=hardness['value'], delta=f"{hardness['delta']}", delta_color='inverse', help='Hardness should be below **250** as recommended by EPA')
+            with col3:
+                ph = report.aesthetics['pH']
+                st.metric(label='pH', value=ph['value'], help='pH levels should be between **6.5 - 8.5** as recommended by EPA')
             st.markdown(
-                """
-                You can be confident in the reliability of the figures as they were obtained directly from your local water utility.
-
-                However, it's important to note that the contents of your tap water may differ between households, even in close proximity. 
-                While the figures presented here provide a solid foundation, for a more comprehensive understanding, it's recommended that you conduct your own testing.
-                """
+                '''
+                
+                '''
             )
-        with st.expander('**What is the difference between a Health Goal vs. Minimum Contaminant Level?**'):
-            st.markdown(
-                """
-                Public health goal (PHG) and minimum contaminant level (MCL) are regulatory standards used in drinking water treatment to ensure that the water is safe to drink. 
-                PHGs are non-enforceable health-based targets set by regulatory agencies to provide a level of protection against significant health risks from drinking water contaminants. 
-                MCLs, on the other hand, are legally enforceable standards set by the Environmental Protection Agency (EPA) under the Safe Drinking Water Act (SDWA). 
-                These standards specify the maximum permissible levels of a chemical contaminant in drinking water that is supplied to the public.
+            st.caption(':blue[TDS] A measure of how much solid particles (dirt, sand, minerals, bacteria, etc.) are present in the water.')
+            st.caption(':blue[Hardness] A measure of how much Magnesium and Calcium are present in the water. The white residue or spots that you see on your glassware is from hard water.')
+            
+            # TODO: Other secondary contaminants that have aesthetic effects on water
+            '---'
 
-                It's important to note that while MCLs are set to protect public health, they are also established taking into account the cost and feasibility requirements of water utilities. 
-                This means that **MCLs may not always be set at the lowest possible level that would provide maximum health protection, but rather at a level that is considered reasonable and achievable given the current state of technology and the resources of water utilities.** 
-                """
-            )
+
+            # -------- TOP 5 CONTAMINANTS --------
+            st.header('Top 5 Contaminants Found in Your Water')
             st.info(
-                """While water utilities focus on MCLs, individuals should pay attention to health standards especially those with severely compromised immune systems, infants, mothers, and the elderly.""",
-                icon='🧐'
+                """
+                The contaminants listed here are only a handful of contaminants found in your water.
+                There are many more that go untested.
+                """,
+                icon='👀'
             )
+            get_contaminants(primary_cont[:5], trends=report.trends, ranks=ranks)
+            
+            placeholder = st.empty()
+            # -------- SHOW REST OF THE LIST --------
+            if placeholder.button('More...'):
+                with placeholder.container():
+                    get_contaminants(primary_cont[5:], 6, trends=report.trends, ranks=ranks)
+
+            # -------- FILTER RECOMMENDATION --------
+            if report.recommendation.covered or report.recommendation.uncovered:
+                st.header('Recommended Filtration')
+                st.markdown(recommendation_text(report.recommendation))
+            
+            '---'
+            st.caption(":blue[Minimum Contaminant Level Goal (MCLG)] A measure set by the EPA based on health effects data, it's the maximum level of a contaminant in drinking water at which no known or anticipated adverse effect on the health of persons would occur, allowing an adequate margin of safety. Note: _MCLG_ and _MRDLG (Minimum Residual Disinfectant Level Goal)_ is used interchangeably in this report.")
+            st.caption(":blue[Minimum Contaminant Level (MCL)] The maximum level allowed of a contaminant in water which is delivered to any user of a public water system strictly based on technical feasibility of treatment. Note: _MCL_ and _MRDL (Minimum Residual Disinfectant Level)_ is used interchangeably in this report.")
+        
+        # -------- ADDITIONAL INFO --------
+        with tab2:
 
-        with st.expander('**How does the EPA decide which contaminant to regulate?**'):
-            st.markdown(
-                f"""
-                The Environmental Protection Agency (EPA) has rules for more than 90 different contaminants in drinking water to make sure it's safe to drink. 
-                The Safe Drinking Water Act (SDWA) lays out a process for the EPA to identify new contaminants that might need regulations. 
-                This includes creating a list of contaminants (called the Contaminant Candidate List) and deciding which of these contaminants should have regulations made for them.
-                
-                The EPA has to make a decision about at least five contaminants from this list every so often (this is called a Regulatory Determination). 
-                This decision starts the process of making a new rule (called a National Primary Drinking Water Regulation) for the specific contaminant. 
-                The EPA uses the list of contaminants to figure out which ones to study first and gather more information on, so they can make a better decision about whether to regulate it.
+            # two pie charts of contaminants exceeding health standards and mcl
+            
+            # Water Supply
+            st.header('Where does your water come from?')
+            st.write(f'{wutility.supply}')
 
-                [Learn more](https://www.epa.gov/sdwa/how-epa-regulates-drinking-water-contaminants).
-                """
-            )
-        with st.expander('**What should I do with this information?**'):
-            st.markdown(
-                """
-                The best we can do is to minimize our exposure to contaminants.
-                The most impactful way to do this is minimizing exposure from your **daily** drinking water.
-                Browse through the contaminants that exceed health standards and get a water filter suited to protect you from that.
-                """
+            # Treatment Process
+            st.subheader('How your water is treated.')
+            st.write(f'{wutility.treatment}')
+        
+        with tab3:
+            st.info(
+                f"""
+                All contaminants, public health goals and minimum contaminant level standards in this 
+                report was sourced from the [EPA](https://www.epa.gov/ground-water-and-drinking-water/national-primary-drinking-water-regulations) 
+                and the latest Consumer Confidence Report ([CCR]({wutility.pdf})) that your
+                local water utility is required to publish annually.
+                """,
+                icon='ℹ️'
             )
+            st.header('Frequently Asked Questions')
+            with st.expander('**How accurate and reliable are the reported figures?**'):
+                st.markdown(
+                    """
+                    You can be confident in the reliability of the figures as they were obtained directly from your local water utility.
+
+                    However, it's important to note that the contents of your tap water may differ between households, even in close proximity. 
+                    While the figures presented here provide a solid foundation, for a more comprehensive understanding, it's recommended that you conduct your own testing.
+                    """
+                )
+            with st.expander('**What is the difference between a Health Goal vs. Minimum Contaminant Level?**'):
+                st.markdown(
+                    """
+                    Public health goal (PHG) and minimum contaminant level (MCL) are regulatory standards used in drinking water treatment to ensure that the water is safe to drink. 
+                    PHGs are non-enforceable health-based targets set by regulatory agencies to provide a level of protection against significant health risks from drinking water contaminants. 
+                    MCLs, on the other hand, are legally enforceable standards set by the Environmental Protection Agency (EPA) under the Safe Drinking Water Act (SDWA). 
+                    These standards specify the maximum permissible levels of a chemical contaminant in drinking water that is supplied to the public.
+
+                    It's important to note that while MCLs are set to protect public health, they are also established taking into account the cost and feasibility requirements of water utilities. 
+                    This means that **MCLs may not always be set at the lowest possible level that would provide maximum health protection, but rather at a level that is considered reasonable and achievable given the current state of technology and the resources of water utilities.** 
+                    """
+                )
+                st.info(
+                    """While water utilities focus on MCLs, individuals should pay attention to health standards especially those with severely compromised immune systems, infants, mothers, and the elderly.""",
+                    icon='🧐'
+                )
+
+            with st.expander('**How does the EPA decide which contaminant to regulate?**'):
+                st.markdown(
+                    f"""
+                    The Environmental Protection Agency (EPA) has rules for more than 90 different contaminants in drinking water to make sure it's safe to drink. 
+                    The Safe Drinking Water Act (SDWA) lays out a process for the EPA to identify new contaminants that might need regulations. 
+                    This includes creating a list of contaminants (called the Contaminant Candidate List) and deciding which of these contaminants should have regulations made for them.
+                    
+                    The EPA has to make a decision about at least five contaminants from this list every so often (this is called a Regulatory Determination). 
+                    This decision starts the process of making a new rule (called a National Primary Drinking Water Regulation) for the specific contaminant. 
+                    The EPA uses the list of contaminants to figure out which ones to study first and gather more information on, so they can make a better decision about whether to regulate it.
+
+                    [Learn more](https://www.epa.gov/sdwa/how-epa-regulates-drinking-water-contaminants).
+                    """
+                )
+            with st.expander('**What should I do with this information?**'):
+                st.markdown(
+                    """
+                    The best we can do is to minimize our exposure to contaminants.
+                    The most impactful way to do this is minimizing exposure from your **daily** drinking water.
+                    Browse through the contaminants that exceed health standards and get a water filter suited to protect you from that.
+                    """
+                )
+                if report.recommendation.covered or report.recommendation.uncovered:
+                    st.success(recommendation_text(report.recommendation))
+                else:
+                    st.success('Nothing in your water was found above its health goal, so no filter is needed for the contaminants tested.')
+            with st.expander('**Where can I find more information about my drinking water and regulations?**'):
+                st.markdown(
+                    f"""
+                    While there are many resources online, we highly recommend EPA's resources on drinking water, which can be found [here](https://www.epa.gov/ground-water-and-drinking-water).
+                    """
+                )
             st.success(
                 """
-                Our personal recommendation is to get a **reverse osmosis** water filtration as that 
-                is the most effective and provides protection from more contaminants that other 
-                filters cannot.
+                Have more questions about your drinking water? Give us an email and we'll be happy to answer them!
+
+                support@waterdoctorusa.com
                 """,
+                icon='✉️'
             )
-        with st.expander('**Where can I find more information about my drinking water and regulations?**'):
-            st.markdown(
-                f"""
-                While there are many resources online, we highly recommend EPA's resources on drinking water, which can be found [here](https://www.epa.gov/ground-water-and-drinking-water).
-                """
-            )
-        st.success(
-            """
-            Have more questions about your drinking water? Give us an email and we'll be happy to answer them!
 
-            support@waterdoctorusa.com
-            """,
-            icon='✉️'
-        )
+    # Add ?debug=1 to the URL to see where this report's time went
+    if st.query_params.get('debug'):
+        with st.expander('Debug'):
+            st.write(f'Report view took {view.total * 1000:.1f} ms')
+            st.json(view.stages_ms())
+            st.json(metrics.cache_stats())
+            st.code(metrics.render_prometheus(), language='text')
 
         
 
@@ -288,6 +337,8 @@ else:
 
         if submit:
             form_request = ZipRequest(zip, email)
-            form_request.add_to_db()
-            st.success('Your request has been submitted!', icon='🥸')
-            st.balloons()
+            if form_request.submit():
+                st.success('Your request has been submitted!', icon='🥸')
+                st.balloons()
+            else:
+                st.info("You're already on the list for this zipcode, we'll let you know!")